@@ -0,0 +1,185 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+from . import Log
+from .Game import Game
+from .Random import Stream
+from .Simulation import cautious, turn
+from .Types import BuyableTile, PropertyTile
+
+# Difficulty levels: number of rollouts per decision and turns played by each
+levels = {
+    "easy": {"rollouts": 8, "horizon": 16},
+    "normal": {"rollouts": 32, "horizon": 32},
+    "hard": {"rollouts": 128, "horizon": 64}
+}
+
+pool = None
+
+def executor():
+    # Process pool shared by every bot
+    global pool
+
+    if pool is None:
+        pool = ProcessPoolExecutor(max_workers=os.cpu_count(), initializer=Log.disable)
+
+    return pool
+
+def warm():
+    # Starts the pool's workers ahead of the first decision, servers should call
+    #   this before starting threads so that workers are forked from a single thread
+    executor().submit(int).result()
+
+def worth(game, player):
+    # Balance plus what the player's tiles cost
+    value = player.balance
+
+    for tile in game.select({"BuyableTile": {"owner": ["=", player.eid]}}) or []:
+        value += tile.price["plot"]
+
+        if isinstance(tile, PropertyTile):
+            value += tile.level * tile.price["house"]
+
+    return value
+
+def score(game, eid):
+    # Share of the net worth of the players still in the game, 0 when bankrupt
+    if eid not in game.order:
+        return 0.0
+
+    worths = [max(0, worth(game, game.players[other])) for other in game.order]
+    total = sum(worths)
+
+    return worths[game.order.index(eid)] / total if total else 0.0
+
+def apply(game, player, action):
+    match action:
+        case ("buy", position):
+            game.tiles[position].buy(game, player)
+
+        case ("upgrade", position):
+            game.tiles[position].upgrade(game, player)
+
+        case ("trade", trade):
+            # Tiles given and taken by position, cash received (negative when paid), see Trade.terms
+            other = game.players[trade["with"]]
+            offer = game.create_trade(player, other, trade.get("give", ()), trade.get("take", ()), trade.get("cash", 0))
+
+            game.settle_trades([offer.id])
+
+def rollouts(state: dict, eid: str, action: tuple, seeds: list, horizon: int, deadline: float):
+    """
+    Plays each seed forward from state twice, with and without the action,
+    for horizon turns with every player following the cautious strategy.
+
+    Seeds are shared by both branches, so the comparison is not swamped by
+    dice luck. Returns [(score with action, score without)] for the seeds
+    played before the deadline (time.time()), later ones are dropped.
+    """
+    # Restored once, every branch plays on a fork
+    base = Game().restore(state)
+    results = []
+
+    for seed in seeds:
+        scores = []
+
+        for act in (True, False):
+            game = base.fork()
+            game.rng = Stream(seed)
+            player = game.players[eid]
+
+            if act:
+                apply(game, player, action)
+
+            # The decision is made mid-turn, finish it first
+            game.next_turn()
+
+            for _ in range(horizon):
+                if len(game.order) < 2:
+                    break
+
+                turn(game, cautious)
+
+            # Running futures cannot be cancelled, workers give up on their own
+            if time.time() >= deadline:
+                return results
+
+            scores.append(score(game, eid))
+
+        results.append(tuple(scores))
+
+    return results
+
+class Bot:
+    """
+    Computer player deciding by rollouts.
+
+    A decision plays the game forward from its current state with and without
+    the action, in a process pool, and takes the action if it scores better on
+    average. Rollouts still running when the budget (seconds) runs out are
+    dropped, workers stop playing them, and when too few have finished the
+    fallback decides.
+    """
+    def __init__(self, level: str="normal", budget: float=0.5):
+        if level not in levels:
+            raise ValueError(f"[Bot] unknown level {level!r}, expected one of {list(levels)}")
+
+        self.level = level
+        self.budget = budget
+        self.rollouts = levels[level]["rollouts"]
+        self.horizon = levels[level]["horizon"]
+
+    @staticmethod
+    def candidate(game, player):
+        # Action available to the player on the tile they stand on, or None
+        tile = game.tiles[player.position]
+        position = player.position
+
+        if not isinstance(tile, BuyableTile):
+            return None
+
+        if tile.owner is None and player.balance >= tile.price["plot"]:
+            return ("buy", position)
+
+        if tile.owner == player and isinstance(tile, PropertyTile) and game.index.monopoly(tile.group, player):
+            if tile.level < len(tile.rent) - 1 and player.balance >= tile.price["house"]:
+                return ("upgrade", position)
+
+        return None
+
+    def evaluate(self, state: dict, eid: str, action: tuple, fallback: bool=False):
+        # Whether to take the action, decided from rollouts of the game state
+        # Rollouts draw from their own streams, the game's is not sent
+        state = {key: value for key, value in state.items() if key != "rng"}
+        # Workers compare against the wall clock, monotonic clocks may not agree across processes
+        deadline = time.time() + self.budget
+        workers = os.cpu_count()
+        seeds = [int.from_bytes(os.urandom(8), "little") for _ in range(self.rollouts)]
+        size = max(1, len(seeds) // (2 * workers))
+
+        pending = {
+            executor().submit(rollouts, state, eid, action, seeds[i:i + size], self.horizon, deadline)
+            for i in range(0, len(seeds), size)
+        }
+
+        results = []
+        while pending and (remaining := deadline - time.time()) > 0:
+            done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+
+            for future in done:
+                results.extend(future.result())
+
+        for future in pending:
+            future.cancel()
+
+        if len(results) < 2:
+            Log.info("bot decision timed out", event="bot", action=action[0], rollouts=len(results))
+
+            return fallback
+
+        gain = sum(act - skip for act, skip in results) / len(results)
+
+        Log.debug("bot decision", event="bot", action=action[0], rollouts=len(results), gain=gain)
+
+        return gain > 0
@@ -0,0 +1,578 @@
+"""
+Batched game engine: many games of a board played in lockstep on NumPy arrays.
+
+Games are stored as arrays (positions, balances, owners, levels, ...) with one
+row per game, and every step plays one turn of all unfinished games with
+vectorized operations. Game i is seeded with seed + i, and draws its dice and
+uniform numbers through the same buffered generator calls as Stream, in the
+same order, so its results are those of Simulation.play with the same seed.
+
+Scripts are compiled to Effects, which cover what boards use: balance changes
+of the player (fixed or in percent), jail, park, and a final move to a tile,
+to the nearest or next tile of a selector, or to a random tile. Boards using
+anything else (decks, other players, moves mid-script, ...) are rejected when
+compiled, Simulation plays them.
+"""
+import copy
+from collections import ChainMap
+
+import numpy as np
+
+from .Game import Game
+from .Index import indexed
+from .Monoscript import Monoscript
+from .Random import Stream
+from .Types import BuyableTile, ChestTile, PropertyTile, Tile
+
+# Number and sides of the dice, as rolled by Game.roll
+dice = (2, 6)
+
+# Vectorized Simulation strategies, deciding for every game at once whether
+#   the active player spends price out of their balance
+def never(balance, price, starting):
+    return np.zeros(len(balance), dtype=bool)
+
+def always(balance, price, starting):
+    return np.ones(len(balance), dtype=bool)
+
+def cautious(balance, price, starting):
+    return balance - price >= starting // 2
+
+strategies = {
+    "never": never,
+    "always": always,
+    "cautious": cautious
+}
+
+class Effect:
+    """
+    Compiled script.
+
+    operations are applied in order to the player's row, as
+        ("balance", delta)            fixed change
+        ("percent", fraction, sign)   change by a fraction of the balance
+        ("jail",)
+        ("park",)
+    then the player moves to destination[position] (no move where it is -1),
+    or to one of choices picked with a uniform draw.
+    """
+    __slots__ = ("operations", "destination", "choices", "instant")
+
+    def __init__(self):
+        self.operations = []
+        self.destination = None
+        self.choices = None
+        self.instant = False
+
+    def moves(self):
+        return self.destination is not None or self.choices is not None
+
+class Board:
+    """
+    Board compiled to arrays for Batch, from a game loaded with the board so
+    selectors resolve exactly as they do in a Game.
+    """
+    def __init__(self, board: str | dict):
+        game = self.game = Game()
+
+        if isinstance(board, dict):
+            game.load(copy.deepcopy(board))
+        else:
+            game.load_from_file(board)
+
+        tiles = game.tiles
+        self.m = m = len(tiles)
+        self.options = dict(game.options)
+
+        jail = game.select({"Tile": {"label": ["=", "Jail"]}})
+        self.jail = game.position(jail[0]) if jail else None
+
+        self.buyable = np.array([isinstance(tile, BuyableTile) for tile in tiles])
+        self.property = np.array([isinstance(tile, PropertyTile) for tile in tiles])
+        self.plot = np.array([tile.price["plot"] if isinstance(tile, BuyableTile) else 0 for tile in tiles])
+        self.house = np.array([tile.price.get("house", 0) if isinstance(tile, BuyableTile) else 0 for tile in tiles])
+
+        # Rent by position and level, padded with the top level's rent
+        depth = max((len(tile.rent) for tile in tiles if isinstance(tile, PropertyTile)), default=1)
+        self.top = np.array([len(tile.rent) - 1 if isinstance(tile, PropertyTile) else 0 for tile in tiles])
+        self.rent = np.array([
+            tile.rent + tile.rent[-1:] * (depth - len(tile.rent)) if isinstance(tile, PropertyTile) else [0] * depth
+            for tile in tiles
+        ])
+
+        # Groups by index, members padded with -1
+        labels = list(dict.fromkeys(tile.group for tile in tiles if isinstance(tile, PropertyTile)))
+        self.group = np.array([labels.index(tile.group) if isinstance(tile, PropertyTile) else -1 for tile in tiles])
+        self.size = np.array([np.count_nonzero(self.group == i) for i in range(len(labels))], dtype=np.int64)
+
+        width = max(self.size, default=0)
+        self.members = np.full((len(labels), width), -1)
+
+        for i in range(len(labels)):
+            positions = np.flatnonzero(self.group == i)
+            self.members[i, :len(positions)] = positions
+
+        # Scripts run when landing, by position (-1 for none), and effects by id
+        self.effects = []
+        self.land = np.full(m, -1)
+
+        for position, tile in enumerate(tiles):
+            if "land" not in tile.programs:
+                continue
+
+            effect = self.compile(tile.programs["land"], tile.label)
+
+            if effect.moves() and isinstance(tile, (ChestTile, PropertyTile)):
+                raise ValueError(f"[Batch] moves on landing on {tile.label!r} are only supported on plain tiles")
+
+            self.land[position] = self.add(effect)
+
+        # Balance change of passing each tile that does something when passed
+        self.passes = []
+
+        for position in game.passes:
+            tile = tiles[position]
+
+            if type(tile).on_pass is not Tile.on_pass:
+                raise ValueError(f"[Batch] {type(tile).__name__} handles passing in code, only scripts are supported")
+
+            effect = self.compile(tile.programs["pass"], tile.label)
+
+            if effect.moves() or any(operation[0] != "balance" for operation in effect.operations):
+                raise ValueError(f"[Batch] passing {tile.label!r} may only change the balance by fixed amounts")
+
+            self.passes.append((position, sum(operation[1] for operation in effect.operations)))
+
+        # Loot tables of chest tiles as padded alias tables, cards by effect id
+        tables = list(dict.fromkeys(tile.table for tile in tiles if isinstance(tile, ChestTile)))
+        columns = max((len(table.probability) for table in tables), default=1)
+
+        for table in tables:
+            if table.deck is not None:
+                raise ValueError(f"[Batch] loot table {table.name!r} is dealt as a deck, which is not supported")
+
+        cards = {}
+        for table in tables:
+            for card in table.data["cards"]:
+                if card not in cards:
+                    cards[card] = self.add(self.compile(game.cards[card].program, game.cards[card].text))
+
+        self.chest = np.array([tables.index(tile.table) if isinstance(tile, ChestTile) else -1 for tile in tiles])
+        self.columns = np.array([len(table.probability) for table in tables], dtype=np.int64)
+        self.probability = np.ones((len(tables), columns))
+        self.alias = np.zeros((len(tables), columns), dtype=np.int64)
+        self.cards = np.zeros((len(tables), columns), dtype=np.int64)
+
+        for i, table in enumerate(tables):
+            n = len(table.probability)
+            self.probability[i, :n] = table.probability
+            self.alias[i, :n] = table.alias
+            self.cards[i, :n] = [cards[card] for card in table.data["cards"]]
+
+    def add(self, effect):
+        self.effects.append(effect)
+
+        return len(self.effects) - 1
+
+    @staticmethod
+    def player(args, index):
+        # Whether a statement applies to the context's player, given or omitted at index
+        return len(args) <= index or args[index] == "$player"
+
+    def static(self, selectors, where):
+        # Selectors whose matches cannot change during a game
+        fields = set(field.split(".")[0] for attrs in selectors.values() if attrs for field in attrs)
+
+        if fields & indexed.names:
+            raise ValueError(f"[Batch] {where!r} selects by {sorted(fields & indexed.names)}, which change during a game")
+
+        return selectors
+
+    def compile(self, program, where):
+        game = self.game
+        effect = Effect()
+        choices = {}
+
+        for instruction in program:
+            handler, args = instruction.handler, instruction.args
+
+            if effect.moves() and handler not in (None, Monoscript.log):
+                raise ValueError(f"[Batch] {where!r} runs statements after a move")
+
+            if handler is None or handler is Monoscript.log:
+                continue
+
+            if handler is Monoscript.random and instruction.target:
+                selectors = {}
+                for arg in args[1:]:
+                    selectors = selectors | self.static(arg, where)
+
+                tiles = game.select(selectors) or []
+
+                if not tiles or not all(isinstance(tile, Tile) for tile in tiles):
+                    raise ValueError(f"[Batch] {where!r} picks at random from entities that are not tiles")
+
+                choices[instruction.target] = np.array([game.position(tile) for tile in tiles])
+
+            elif handler is Monoscript.balance and len(args) in (3, 4) and Board.player(args, 2 if len(args) == 4 else 4):
+                mode, amount = args[1], args[-1]
+
+                if mode not in ("add", "sub") or amount.startswith("$"):
+                    raise ValueError(f"[Batch] unsupported balance statement in {where!r}")
+
+                # Same arithmetic as Monoscript.balance
+                if amount.endswith("%"):
+                    effect.operations.append(("percent", float(amount[:-1]) / 100.0, -1 if mode == "sub" else 1))
+                else:
+                    delta = float(amount)
+                    effect.operations.append(("balance", int(-delta if mode == "sub" else delta)))
+
+            elif handler is Monoscript.jail and Board.player(args, 1):
+                if self.jail is None:
+                    raise ValueError(f"[Batch] {where!r} jails on a board without a Jail tile")
+
+                effect.operations.append(("jail",))
+
+            elif handler is Monoscript.park and Board.player(args, 1):
+                effect.operations.append(("park",))
+
+            elif handler is Monoscript.move and args[1] == "$player" and len(args) > 3:
+                mode, *rest = args[2:]
+
+                if mode == "instant":
+                    effect.instant = True
+                    mode, *rest = rest
+
+                if mode == "to" and isinstance(rest[0], str) and rest[0].startswith("$"):
+                    if rest[0][1:] not in choices:
+                        raise ValueError(f"[Batch] {where!r} moves to {rest[0]}, which is not a random pick")
+
+                    effect.choices = choices[rest[0][1:]]
+
+                elif mode == "to":
+                    tiles = game.select(self.static(rest[0], where))
+
+                    if not tiles:
+                        raise ValueError(f"[Batch] {where!r} moves to a tile that does not exist")
+
+                    effect.destination = np.full(self.m, game.position(tiles[0]))
+
+                elif mode in ("near", "next"):
+                    selectors = self.static(ChainMap(*rest), where)
+                    nearest = [game.nearest(selectors, position, mode == "next") for position in range(self.m)]
+
+                    effect.destination = np.array([found[0] if found else -1 for found in nearest])
+
+                else:
+                    raise ValueError(f"[Batch] unsupported move statement in {where!r}")
+
+            else:
+                raise ValueError(f"[Batch] unsupported statement {' '.join(map(str, args))!r} in {where!r}")
+
+        return effect
+
+class Batch:
+    """
+    Games of a compiled board, played in lockstep until each has a single
+    player left or has reached the given number of turns.
+
+    Players are seats 0 to players - 1 in the order they joined, so a seat is
+    the index of a player in Simulation.play's results.
+
+    State is kept in flat arrays, which NumPy indexes several times faster
+    than by (row, column): players by game * players + seat, tiles by
+    game * tiles + position. Methods take games g with their players' indices k.
+    """
+    def __init__(self, board: Board, games: int, players: int=4, strategy: str="cautious", seed: int=0, turns: int=1000):
+        if strategy not in strategies:
+            raise ValueError(f"[Batch] unknown strategy {strategy!r}, expected one of {list(strategies)}")
+
+        self.board = board
+        self.games = games
+        self.players = players
+        self.decide = strategies[strategy]
+        self.turns = turns
+        self.starting = board.options["starting"]
+
+        n, m, groups = games, board.m, len(board.size)
+
+        self.position = np.zeros(n * players, dtype=np.int64)
+        self.balance = np.full(n * players, self.starting, dtype=np.int64)
+        self.parked = np.zeros(n * players, dtype=np.int64)
+        self.owner = np.full(n * m, -1, dtype=np.int64)
+        self.level = np.zeros(n * m, dtype=np.int64)
+        self.rents = np.zeros(n * m, dtype=np.int64)
+
+        # Tiles held by (game, group, seat)
+        self.holdings = np.zeros(n * groups * players, dtype=np.int64)
+
+        # Seats in turn order, the first alive[g] of a row are still playing
+        self.order = np.tile(np.arange(players), (n, 1))
+        self.alive = np.full(n, players)
+        self.active = np.zeros(n, dtype=np.int64)
+        self.turn = np.zeros(n, dtype=np.int64)
+        self.bankruptcies = np.zeros(n, dtype=np.int64)
+
+        # Buffers of dice sums and uniforms per game, refilled by the game's
+        #   generator exactly when its Stream would refill them
+        self.generators = [np.random.default_rng(seed + i) for i in range(n)]
+        self.buffers = {"dice": np.zeros(n * Stream.size, dtype=np.int64), "uniform": np.zeros(n * Stream.size)}
+        self.drawn = {"dice": np.full(n, Stream.size), "uniform": np.full(n, Stream.size)}
+
+        self.start()
+
+    def draw(self, kind, g):
+        # One draw of the kind for each game in g
+        drawn, buffer = self.drawn[kind], self.buffers[kind].reshape(self.games, Stream.size)
+
+        for i in g[drawn[g] == Stream.size]:
+            if kind == "dice":
+                buffer[i] = self.generators[i].integers(1, dice[1] + 1, size=(Stream.size, dice[0])).sum(axis=1)
+            else:
+                buffer[i] = self.generators[i].random(Stream.size)
+
+            drawn[i] = 0
+
+        index = drawn[g]
+        drawn[g] = index + 1
+
+        return self.buffers[kind][g * Stream.size + index]
+
+    def start(self):
+        g = np.arange(self.games)
+
+        # Fisher-Yates, as Stream.shuffle
+        if self.board.options["randomize"]:
+            for i in range(self.players - 1, 0, -1):
+                j = (self.draw("uniform", g) * (i + 1)).astype(np.int64)
+                swapped = self.order[g, j]
+                self.order[g, j] = self.order[g, i]
+                self.order[g, i] = swapped
+
+        self.turn[:] = 1
+
+    def apply(self, effect, g, k):
+        # Runs an effect for the players k of games g, returns the games and players that move
+        for operation in effect.operations:
+            match operation:
+                case ("balance", delta):
+                    self.balance[k] += delta
+
+                case ("percent", fraction, sign):
+                    self.balance[k] += np.trunc(self.balance[k] * fraction * sign).astype(np.int64)
+
+                case ("jail",):
+                    self.position[k] = self.board.jail
+
+                case ("park",):
+                    self.parked[k] = 1
+
+        if effect.choices is not None:
+            u = self.draw("uniform", g)
+            destination = effect.choices[(u * len(effect.choices)).astype(np.int64)]
+        elif effect.destination is not None:
+            destination = effect.destination[self.position[k]]
+            moves = destination >= 0
+            g, k, destination = g[moves], k[moves], destination[moves]
+        else:
+            return g[:0], k[:0]
+
+        self.move(k, destination, effect.instant)
+
+        return g, k
+
+    def move(self, k, destination, instant=False):
+        # Moves forward, running the scripts of the tiles passed on the way
+        m = self.board.m
+
+        if not instant and self.board.passes:
+            initial = self.position[k]
+            distance = (destination - initial) % m
+
+            for position, delta in self.board.passes:
+                offset = (position - initial) % m
+                self.balance[k] += delta * ((offset > 0) & (offset < distance))
+
+        self.position[k] = destination
+
+    def land(self, g, k):
+        # Lands players k of games g on their tile, until no script moves them again
+        board = self.board
+
+        while len(g):
+            q = self.position[k]
+            moved = []
+
+            # Scripts of the tile, then what its type does (draw a card, charge rent)
+            land = board.land[q]
+            if (scripted := land >= 0).any():
+                for effect in np.unique(land[scripted]):
+                    selected = land == effect
+                    moved.append(self.apply(board.effects[effect], g[selected], k[selected]))
+
+            chest = board.chest[q]
+            if (drawing := chest >= 0).any():
+                gc, kc, table = g[drawing], k[drawing], chest[drawing]
+
+                # Vose alias draw, as LootTable.column
+                x = self.draw("uniform", gc) * board.columns[table]
+                i = x.astype(np.int64)
+                column = np.where(x - i < board.probability[table, i], i, board.alias[table, i])
+                cards = board.cards[table, column]
+
+                for effect in np.unique(cards):
+                    selected = cards == effect
+                    moved.append(self.apply(board.effects[effect], gc[selected], kc[selected]))
+
+            t = g * board.m + q
+            owner = self.owner[t]
+            if (charged := board.property[q] & (owner >= 0) & (owner != k - g * self.players)).any():
+                self.charge(g[charged], k[charged], q[charged], owner[charged])
+
+            g = np.concatenate([gm for gm, _ in moved]) if moved else g[:0]
+            k = np.concatenate([km for _, km in moved]) if moved else k[:0]
+
+    def held(self, g, group, seat):
+        # Indices of holdings
+        return (g * len(self.board.size) + group) * self.players + seat
+
+    def charge(self, g, k, q, owner):
+        # Rent, as PropertyTile.rent_due and Player.debit
+        board = self.board
+        t = g * board.m + q
+        level = self.level[t]
+        rent = board.rent[q, level]
+
+        if board.options["doubleRent"]:
+            group = board.group[q]
+            rent = np.where((level == 0) & (self.holdings[self.held(g, group, owner)] == board.size[group]), rent * 2, rent)
+
+        balance = self.balance[k]
+        self.balance[g * self.players + owner] += np.minimum(np.maximum(balance, 0), rent)
+        self.balance[k] = balance - rent
+        self.rents[t] += rent
+
+    def invest(self, g, k):
+        # Buys or upgrades the tile landed on, as decided by the strategy
+        board = self.board
+        q = self.position[k]
+        t = g * board.m + q
+        owner = self.owner[t]
+        balance = self.balance[k]
+
+        price = board.plot[q]
+        buying = board.buyable[q] & (owner < 0)
+        buying &= self.decide(balance, price, self.starting) & (balance >= price)
+
+        if buying.any():
+            gb, kb, qb, tb = g[buying], k[buying], q[buying], t[buying]
+            seat = kb - gb * self.players
+
+            self.balance[kb] -= price[buying]
+            self.owner[tb] = seat
+
+            grouped = board.group[qb] >= 0
+            self.holdings[self.held(gb[grouped], board.group[qb[grouped]], seat[grouped])] += 1
+
+        upgrading = board.property[q] & (owner == k - g * self.players)
+
+        if upgrading.any():
+            gu, ku, qu, tu = g[upgrading], k[upgrading], q[upgrading], t[upgrading]
+            level, group, price, balance = self.level[tu], board.group[qu], board.house[qu], self.balance[ku]
+
+            allowed = self.decide(balance, price, self.starting) & (level < board.top[qu]) & (balance >= price)
+            allowed &= self.holdings[self.held(gu, group, ku - gu * self.players)] == board.size[group]
+
+            if board.options["evenBuild"]:
+                members = board.members[group]
+                levels = np.where(members >= 0, self.level[gu[:, None] * board.m + members], np.iinfo(np.int64).max)
+                allowed &= level <= levels.min(axis=1)
+
+            self.balance[ku[allowed]] -= price[allowed]
+            self.level[tu[allowed]] += 1
+
+    def next_turn(self, g):
+        # As Game.next_turn: parked players are skipped, without starting a turn
+        alive = self.alive[g]
+        active = (self.active[g] + 1) % alive
+        k = g * self.players + self.order[g, active]
+
+        parked = self.parked[k] > 0
+        self.parked[k[parked]] -= 1
+        self.active[g] = np.where(parked, (active + 1) % alive, active)
+        self.turn[g[~parked]] += 1
+
+    def bankrupt(self, i, seat):
+        # As Game.bankrupt, for one game
+        alive = self.alive[i]
+        index = list(self.order[i, :alive]).index(seat)
+
+        self.order[i, index:alive - 1] = self.order[i, index + 1:alive]
+        self.alive[i] = alive = alive - 1
+
+        if index < self.active[i]:
+            self.active[i] -= 1
+
+        if alive:
+            self.active[i] %= alive
+
+        tiles = slice(i * self.board.m, (i + 1) * self.board.m)
+        owned = self.owner[tiles] == seat
+        self.owner[tiles][owned] = -1
+        self.level[tiles][owned] = 0
+        self.holdings[self.held(i, np.arange(len(self.board.size)), seat)] = 0
+        self.bankruptcies[i] += 1
+
+    def step(self):
+        # Plays a turn of every unfinished game, returns how many were played
+        g = np.flatnonzero((self.alive > 1) & (self.turn < self.turns))
+        k = g * self.players + self.order[g, self.active[g]]
+
+        self.move(k, (self.position[k] + self.draw("dice", g)) % self.board.m)
+        self.land(g, k)
+        self.invest(g, k)
+        self.next_turn(g)
+
+        # Bankruptcies are rare, games are handled one at a time
+        broke = self.balance[k] < 0
+
+        for i, player in zip(g[broke], k[broke]):
+            self.bankrupt(i, player - i * self.players)
+
+        return len(g)
+
+    def run(self):
+        # Plays every game to its end, returns the number of turns played
+        played = 0
+
+        while turns := self.step():
+            played += turns
+
+        return played
+
+    def results(self):
+        # Statistics of every game, as returned by Simulation.play
+        rents = self.rents.reshape(self.games, self.board.m)
+
+        return [
+            {
+                "turns": int(self.turn[i]),
+                "bankruptcies": int(self.bankruptcies[i]),
+                "winner": int(self.order[i, 0]) if self.alive[i] == 1 else None,
+                "rent": rents[i].tolist()
+            }
+            for i in range(self.games)
+        ]
+
+def play(board: str | dict | Board, games: int, players: int=4, strategy: str="cautious", seed: int=0, turns: int=1000):
+    """
+    Play games of a board in lockstep and return their statistics, game i
+    being seeded with seed + i (see Simulation.play).
+    """
+    if not isinstance(board, Board):
+        board = Board(board)
+
+    batch = Batch(board, games, players, strategy, seed, turns)
+    batch.run()
+
+    return batch.results()
@@ -0,0 +1,222 @@
+import copy
+import json
+import time
+import platform
+from itertools import cycle
+
+from . import Log
+from .Game import Game
+from .Event import PlayerBalanceUpdated
+from .Monoscript import Selector
+from .Simulation import play
+from .Batch import Batch, Board
+
+def synthetic(dimension: int, template: str="./boards/wordwide.json"):
+    """
+    Board with the given dimension, i.e. 4 * (dimension - 1) tiles.
+
+    Loot tables, cards and industries are the template's. Corners are Go, Jail,
+    Vacation and Go To Jail, the sides repeat a pattern of properties (in groups
+    of three), chests, companies and taxes.
+    """
+    with open(template, "rb") as f:
+        board = json.load(f)
+
+    count = 4 * (dimension - 1)
+    pattern = ["Property", "Chest", "Property", "Property", "Company", "Tax", "Property", "Chest", "Property", "Property", "Company"]
+    corners = {
+        0: {"type": "Action", "label": "Go", "events": {"pass": ["balance add $player 200"]}},
+        count // 4: {"type": "Tile", "label": "Jail"},
+        count // 2: {"type": "Action", "label": "Vacation", "events": {"land": ["park"]}},
+        3 * count // 4: {"type": "Action", "label": "Go To Jail", "events": {"land": ["jail $player"]}}
+    }
+
+    tiles, groups = [], []
+    properties = 0
+    kinds = cycle(pattern)
+
+    for position in range(count):
+        if position in corners:
+            tiles.append(corners[position])
+            continue
+
+        match next(kinds):
+            case "Property":
+                if properties % 3 == 0:
+                    groups.append({"label": f"Group {len(groups)}", "color": "#FFFFFF"})
+
+                price = 60 + 4 * (properties // 3)
+                tiles.append({
+                    "type": "Property",
+                    "label": f"Property {properties}",
+                    "group": groups[-1]["label"],
+                    "price": {"plot": price, "house": price},
+                    "rent": [price // 10 * n for n in (1, 5, 15, 45, 80, 125)]
+                })
+                properties += 1
+
+            case "Chest":
+                tiles.append({"type": "Chest", "label": f"Chest {position}", "table": ("chest", "chance")[position % 2]})
+
+            case "Company":
+                tiles.append({"type": "Company", "label": f"Company {position}", "industry": ("airport", "utility")[position % 2], "price": {"plot": 200}})
+
+            case "Tax":
+                tiles.append({"type": "Action", "label": f"Tax {position}", "events": {"land": ["balance sub 75"]}})
+
+    board["properties"] = {"name": f"Synthetic {dimension}", "dimension": dimension}
+    board["groups"] = groups
+    board["tiles"] = tiles
+
+    return board
+
+def create(board: dict, players: int=4, seed: int=0):
+    # Started game of a board with rich players, so that nobody goes bankrupt
+    game = Game(seed)
+    game.load(copy.deepcopy(board))
+
+    for i in range(players):
+        game.add_player(f"player{i}", 10 ** 9)
+
+    game.start()
+
+    return game
+
+# Benchmarks take a board and a seed and return (setup, run, operations), where
+#   run(setup()) performs the operations. Only run is timed.
+def load(board, seed, n=20):
+    return (lambda: [copy.deepcopy(board) for _ in range(n)]), (lambda boards: [Game().load(b) for b in boards]), n
+
+def roll(board, seed, n=2000):
+    def run(game):
+        for _ in range(n):
+            game.roll()
+            game.next_turn()
+
+    return (lambda: create(board, seed=seed)), run, n
+
+def select(board, seed, n=2000):
+    selectors = [Selector.parse(s) for s in ("Tile[label=Jail]", "CompanyTile[industry=airport]", "PropertyTile[level>0]", "BuyableTile")]
+
+    def run(game):
+        for selector, _ in zip(cycle(selectors), range(n)):
+            game.select(selector)
+
+    return (lambda: create(board, seed=seed)), run, n
+
+def nearest(board, seed, n=2000):
+    selectors = [Selector.parse(s) for s in ("CompanyTile[industry=airport]", "CompanyTile[industry=utility]", "PropertyTile[level=0]")]
+
+    def run(game):
+        m = len(game.tiles)
+
+        for i, selector in zip(range(n), cycle(selectors)):
+            game.nearest(selector, i % m)
+
+    return (lambda: create(board, seed=seed)), run, n
+
+def monoscript(board, seed, n=2000):
+    script = ["amount = 10", "balance add $player $amount", "balance sub $player $amount", "log $player[name] paid $amount"]
+
+    def run(game):
+        context = {"player": game.active_player()}
+
+        for _ in range(n):
+            game.monoscript.execute(script, context)
+
+    return (lambda: create(board, seed=seed)), run, n
+
+def card(board, seed, n=2000):
+    def run(game):
+        player = game.active_player()
+
+        for card, _ in zip(cycle(game.cards), range(n)):
+            card.execute(game, player)
+
+    return (lambda: create(board, seed=seed)), run, n
+
+def dispatch(board, seed, n=20000):
+    def run(game):
+        event = PlayerBalanceUpdated(game.active_player(), 0)
+
+        for _ in range(n):
+            game.events += event
+
+    return (lambda: create(board, seed=seed)), run, n
+
+def game(board, seed, n=4):
+    # Whole games played by the simulation, counted in turns
+    def run(_):
+        return sum(play(board, 4, "cautious", seed + i, 500)["turns"] for i in range(n))
+
+    return (lambda: None), run, None
+
+def batch(board, seed, n=1000):
+    # Games played in lockstep by the batched engine, counted in turns
+    compiled = Board(board)
+
+    return (lambda: Batch(compiled, n, 4, "cautious", seed, 500)), (lambda games: games.run()), None
+
+benchmarks = {
+    "load": load,
+    "roll": roll,
+    "select": select,
+    "nearest": nearest,
+    "monoscript": monoscript,
+    "card": card,
+    "dispatch": dispatch,
+    "game": game,
+    "batch": batch
+}
+
+def measure(benchmark, board, seed: int=0, repeat: int=5):
+    # Best throughput over repeat runs, in operations (or turns) per second
+    setup, run, operations = benchmark(board, seed)
+    best = 0.0
+
+    for _ in range(repeat):
+        state = setup()
+
+        start = time.perf_counter()
+        done = run(state)
+        elapsed = time.perf_counter() - start
+
+        best = max(best, (operations or done) / elapsed)
+
+    return best
+
+def run(boards: dict, names: list=None, seed: int=0, repeat: int=5):
+    """
+    Run the benchmarks on every board, returning machine-readable results.
+
+    Results are operations per second by board name and benchmark, the game
+    and batch benchmarks report turns per second.
+    """
+    names = names or list(benchmarks)
+    results = {}
+
+    # Logging would dominate the timings, it is switched back on afterwards
+    with Log.disabled():
+        for label, board in boards.items():
+            results[label] = {name: measure(benchmarks[name], board, seed, repeat) for name in names}
+
+    return {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "seed": seed,
+        "results": results
+    }
+
+def compare(baseline: dict, current: dict, threshold: float=0.2):
+    # Benchmarks slower than the baseline by more than threshold (a fraction)
+    #   as [(board, benchmark, baseline, current)]
+    regressions = []
+
+    for label, results in current["results"].items():
+        for name, value in results.items():
+            expected = baseline["results"].get(label, {}).get(name)
+
+            if expected and value < expected * (1 - threshold):
+                regressions.append((label, name, expected, value))
+
+    return regressions
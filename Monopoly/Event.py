@@ -1,25 +1,38 @@
 import functools
+from time import perf_counter
+
 from .Types import *
+from .Metrics import metrics
 
 class Event:
+    __slots__ = ("message",)
+
     def __init__(self, message: str):
         self.message = message
 
-    def __str__(self):
-        fields = []
-
-        for key, val in self.__dict__.items():
-            fields.append(f"{key}={val}")
+    def fields(self):
+        # Event fields in declaration order, from the most general event type
+        return {
+            key: getattr(self, key)
+            for cls in reversed(type(self).__mro__)
+            for key in getattr(cls, "__slots__", ())
+            if hasattr(self, key)
+        }
 
-        fields = ", ".join(fields)
+    def __str__(self):
+        fields = ", ".join(f"{key}={val}" for key, val in self.fields().items())
 
         return f"{self.__class__.__name__}({fields})"
 
 class PlayerEvent(Event):
+    __slots__ = ("player",)
+
     def __init__(self, player: Player):
         self.player = player
 
 class PlayerMoveEvent(PlayerEvent):
+    __slots__ = ("initial", "final", "teleport")
+
     def __init__(self, player: Player, initial: int, final: int, teleport: bool=False):
         super().__init__(player)
         self.initial = initial
@@ -27,16 +40,30 @@ class PlayerMoveEvent(PlayerEvent):
         self.teleport = teleport
 
 class PropertyPurchaseEvent(PlayerEvent):
+    __slots__ = ("tile",)
+
     def __init__(self, player: Player, tile: BuyableTile):
         super().__init__(player)
         self.tile = tile
 
 class PropertyUpgradeEvent(PlayerEvent):
+    __slots__ = ("tile",)
+
     def __init__(self, player: Player, tile: PropertyTile):
         super().__init__(player)
         self.tile = tile
 
+class TradeEvent(PlayerEvent):
+    # Dispatched for the seller once a trade has settled
+    __slots__ = ("trade",)
+
+    def __init__(self, player: Player, trade):
+        super().__init__(player)
+        self.trade = trade
+
 class PlayerBalanceUpdated(PlayerEvent):
+    __slots__ = ("delta", "creditor")
+
     def __init__(self, player: Player, delta: int, creditor: Player=None):
         super().__init__(player)
 
@@ -44,18 +71,34 @@ class PlayerBalanceUpdated(PlayerEvent):
         self.creditor = creditor
 
 class PlayerJailedEvent(PlayerEvent):
+    __slots__ = ()
+
     def __init__(self, player: Player):
         super().__init__(player)
 
 class PlayerParkedEvent(PlayerEvent):
+    __slots__ = ()
+
     def __init__(self, player: Player):
         super().__init__(player)
 
+class PlayerBankruptEvent(PlayerEvent):
+    # Dispatched once the player has left the game, tiles are the released positions
+    __slots__ = ("tiles",)
+
+    def __init__(self, player: Player, tiles: list):
+        super().__init__(player)
+        self.tiles = tiles
+
 class TurnEnd(PlayerEvent):
+    __slots__ = ()
+
     def __init__(self, player: Player):
         super().__init__(player)
 
 class TurnStart(PlayerEvent):
+    __slots__ = ()
+
     def __init__(self, player: Player):
         super().__init__(player)
 
@@ -63,6 +106,9 @@ class EventDispatcher:
     def __init__(self):
         self.handlers = {}
 
+        # Handlers per concrete event type, resolved from the MRO on first dispatch
+        self.dispatch = {}
+
     def add_handler(self, event, handler):
         if not hasattr(handler, "__iter__"):
             handler = [handler]
@@ -75,10 +121,34 @@ class EventDispatcher:
             event = [Event]
 
         for e in event:
-            if e not in self.handlers:
-                self.handlers[e] = handler
-            else:
-                self.handlers[e] += handler
+            self.handlers.setdefault(e, []).extend(handler)
+
+        self.dispatch.clear()
+
+    def remove_handler(self, event, handler):
+        if not hasattr(event, "__iter__"):
+            event = [event]
+
+        if Event in event:
+            event = [Event]
+
+        for e in event:
+            if handler in self.handlers.get(e, ()):
+                self.handlers[e].remove(handler)
+
+        self.dispatch.clear()
+
+    def resolve(self, cls):
+        # Handlers of the most general event types run first, e.g. Event, PlayerEvent, PlayerMoveEvent
+        handlers = tuple(
+            handler
+            for base in reversed(cls.__mro__)
+            for handler in self.handlers.get(base, ())
+        )
+
+        self.dispatch[cls] = handlers
+
+        return handlers
 
     def __ior__(self, args):
         if len(args) != 2:
@@ -92,22 +162,31 @@ class EventDispatcher:
         if not isinstance(obj, Event):
             raise TypeError(f"[EventDispatcher] expected instance of {Event}, got instead {type(obj)}")
 
-        if Event in self.handlers:
-            for handler in self.handlers[Event]:
-                handler(obj)
+        handlers = self.dispatch.get(type(obj))
+
+        if handlers is None:
+            handlers = self.resolve(type(obj))
 
-        if type(obj) == Event:
-            return self
+        if metrics.sample():
+            self.timed(obj, handlers)
+        else:
+            for handler in handlers:
+                handler(obj)
 
-        if type(obj) not in self.handlers:
-            print(f"[EventDispatcher] event {obj} has no handlers")
+        return self
 
-            return self
+    @staticmethod
+    def timed(obj, handlers):
+        # Dispatch that records the time of the event and of each handler
+        event = type(obj).__name__
+        start = perf_counter()
 
-        for handler in self.handlers[type(obj)]:
+        for handler in handlers:
+            begin = perf_counter()
             handler(obj)
+            metrics.observe("monopoly_handler_seconds", (("event", event), ("handler", getattr(handler, "__qualname__", repr(handler)))), perf_counter() - begin)
 
-        return self
+        metrics.observe("monopoly_event_seconds", (("event", event),), perf_counter() - start)
 
 def bindlisteners(cls):
     """
@@ -116,25 +195,35 @@ def bindlisteners(cls):
     Looks for methods decorated with "listen" and adds the method as
     an event handler for the instance's EventDispatcher.
     """
+    # Check for any methods decorated with "eventhandler", once per class
+    listeners = []
+    for fname in dir(cls):
+        func = getattr(cls, fname)
+
+        if not callable(func):
+            continue
+
+        # walrus (:3 っ)っ ;)
+        if event := getattr(func, "_event", None):
+            listeners.append((fname, event))
+
     @functools.wraps(cls)
     def create(*args, **kwargs):
         instance = cls(*args, **kwargs)
 
-        # Check for any methods decorated with "eventhandler"
-        # If so, add the method as an event handler with the associated event
-        for fname in dir(instance):
-            func = getattr(instance, fname)
-
-            if not callable(func):
-                continue
-
-            # walrus (:3 っ)っ ;)
-            if event := getattr(func, "_event", None):
-                instance.events |= event, func
+        # Add each listener method as an event handler with the associated event
+        for fname, event in listeners:
+            instance.events |= event, getattr(instance, fname)
 
         return instance
     return create
 
+def unbindlisteners(instance):
+    # Removes the event handlers added by bindlisteners for an instance
+    for fname in dir(type(instance)):
+        if event := getattr(getattr(type(instance), fname), "_event", None):
+            instance.events.remove_handler(event, getattr(instance, fname))
+
 def listen(*events):
     def handler(func):
         setattr(func, "_event", events)
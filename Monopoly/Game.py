@@ -1,17 +1,28 @@
+import os
 import json
 import operator
-from random import choice, randint, shuffle
+from bisect import bisect_left
 from functools import reduce
 from uuid import uuid4
 
+from . import Log
 from .Event import *
 from .Types import Player
-from .Monoscript import Monoscript
+from .Monoscript import Monoscript, Selector
+from .Index import EntityIndex, indexed
+from .Random import Stream
+from .Trade import Trade, TradeBook
+
+# Loaded boards shared between games, by path: (mtime, template Game)
+templates = {}
 
 @bindlisteners
 class Game():
-    def __init__(self):
+    def __init__(self, seed: int=None):
         self.events = EventDispatcher()
+
+        # Every random draw of the game comes from its stream, a game is replayed from its seed
+        self.rng = Stream(seed)
         self.monoscript = Monoscript(self)
 
         self.options = {
@@ -19,6 +30,7 @@ class Game():
             "mortage": True,
             "starting": 2000,
             "evenBuild": True,
+            "doubleRent": True,
             "collectInJail": False,
             "turnsInJail": 3
         }
@@ -28,23 +40,72 @@ class Game():
         self.parked = {}
         self.order = []
         self.entities = {}
-        self.trades = {}
+        self.index = EntityIndex(self.entities)
+        self.positions = {}
+        self.passes = []
+        self.buyables = []
+
+        # Loot table eid -> [cards, undealt count] for tables dealt as decks
+        self.decks = {}
+        self.tables = {}
+        self.trades = TradeBook()
         self.turn = 0
+        self.source = None
         self.active = None
 
-    def create_trade(self, seller: Player, buyer: Player):
-        pass
+    def create_trade(self, seller: Player, buyer: Player, give=(), take=(), cash: int=0):
+        # Proposes a trade, see Trade. It is only checked when settled
+        return self.trades.add(Trade(seller.eid, buyer.eid, give, take, cash))
 
-    def jail(self, player):
-        from .Monoscript import Selector
+    def settle_trades(self, ids):
+        # Settles accepted trades by id in one batch, see TradeBook.settle
+        return self.trades.settle(self, ids)
 
+    def jail(self, player):
         jail = self.select(Selector.parse("Tile[label=Jail]"))[0]
-        player.position = self.tiles.index(jail)
+        player.position = self.position(jail)
 
         self.jailed[player] = self.options["turnsInJail"]
+        self.events += PlayerJailedEvent(player)
 
     def park(self, player, turns=1):
         self.parked[player] = turns
+        self.events += PlayerParkedEvent(player)
+
+    def bankrupt(self, player):
+        # Remove a player from the turn order and release their properties
+        index = self.order.index(player.eid)
+        self.order.pop(index)
+
+        if index < self.active:
+            self.active -= 1
+
+        if self.order:
+            self.active %= len(self.order)
+
+        self.jailed.pop(player, None)
+        self.parked.pop(player, None)
+        self.trades.withdraw_player(player.eid)
+
+        released = []
+
+        for tile in self.select(Selector.parse(f"BuyableTile[owner={player.eid}]")) or []:
+            tile.owner = None
+
+            if hasattr(tile, "level"):
+                tile.level = 0
+
+            released.append(self.position(tile))
+
+        self.events += PlayerBankruptEvent(player, released)
+
+    def net_debts(self):
+        # Settles circular debts between players in one pass, see Ledger.net
+        from .Ledger import Ledger
+
+        for player, amount in Ledger.net(self.players.values()).items():
+            player.balance += amount
+            self.events += PlayerBalanceUpdated(player, amount)
 
     def advance(self, player, n=0):
         initial = player.position
@@ -57,7 +118,7 @@ class Game():
 
     def roll(self, n=2, s=6):
         # Roll n s-sided dice
-        dice = [randint(1, s) for _ in range(n)]
+        dice = self.rng.roll(n, s)
 
         player = self.active_player()
         self.advance(player, sum(dice))
@@ -69,12 +130,14 @@ class Game():
 
     def start(self):
         if self.options["randomize"]:
-            shuffle(self.order)
+            self.rng.shuffle(self.order)
 
         for player in self.players.values():
             self.parked[player] = 0
             self.jailed[player] = 0
 
+        Log.info("game started with seed %s", self.rng.seed, event="start", seed=self.rng.seed, order=list(self.order))
+
         self.active = 0
         self.events += TurnStart(self.active_player())
 
@@ -98,47 +161,90 @@ class Game():
 
     @listen(PropertyPurchaseEvent)
     def on_purchase(self, event: PropertyPurchaseEvent):
-        print(f"{event.tile!r} purchased by {event.player!r}")
+        Log.info(
+            "%s purchased by %s", event.tile.label, event.player.name,
+            event="purchase", tile=event.tile.label, player=event.player.eid, balance=event.player.balance
+        )
 
     @listen(PlayerMoveEvent)
     def on_move(self, event: PlayerMoveEvent):
         if not event.teleport:
-            m = len(self.tiles)
-            distance = self.distance(event.initial, event.final)
-
-            # Trigger on pass
-            for i in range(1, distance):
-                tile = self.tiles[(event.initial + i) % m]
-                tile.on_pass(self, event.player)
+            # Trigger on pass, only tiles that handle it are visited
+            for position in self.passed(event.initial, self.distance(event.initial, event.final)):
+                self.tiles[position].on_pass(self, event.player)
 
         tile = self.tiles[event.final]
 
-        print(f"player {event.player!r} landed on {tile!r}")
+        Log.info(
+            "player %s landed on %s", event.player.name, tile.label,
+            event="land", tile=tile.label, player=event.player.eid, position=event.final, balance=event.player.balance
+        )
         tile.on_land(self, event.player)
 
     def execute(self, *args, **kwargs):
         self.monoscript.execute(*args, **kwargs)
 
     def load_from_file(self, file: str="./board.json"):
-        # Load a board object from JSON
-        with open(file, "rb") as data:
-            board = json.load(data)
-
-        self.load(board)
+        # Boards are parsed once per file version into a template game, later
+        #   games of the same board are instantiated from the template
+        path = os.path.realpath(file)
+        mtime = os.stat(path).st_mtime_ns
+
+        cached = templates.get(path)
+
+        if cached and cached[0] == mtime:
+            template = cached[1]
+        else:
+            with open(path, "rb") as data:
+                board = json.load(data)
+
+            template = Game()
+            template.load(board)
+            templates[path] = (mtime, template)
+
+        self.instantiate(template)
+        self.source = file
+
+    def instantiate(self, template):
+        # Share the template's board and immutable entities (loot tables, cards,
+        #   industries, groups and non-buyable tiles), only buyable tiles are
+        #   copied since their owner and level change during a game
+        self.board = template.board
+        self.lootTables = template.lootTables
+        self.cards = template.cards
+        self.industries = template.industries
+        self.groups = template.groups
+        self.entities = dict(template.entities)
+        self.index = template.index.fork(self.entities)
+        self.tiles = list(template.tiles)
+
+        for position in template.buyables:
+            clone = self.tiles[position] = self.tiles[position].copy(self.index)
+            self.entities[clone.eid] = clone
+
+        # Entity ids are the template's, so positions and static tables are the same
+        self.positions = template.positions
+        self.passes = template.passes
+        self.buyables = template.buyables
+        self.tables = template.tables
 
     def create_object(self, cls, *args, **kwargs):
         instance = cls(*args, **kwargs)
-        eid = str(uuid4())
-        setattr(instance, "eid", eid)
+        instance.eid = str(uuid4())
+        instance.id = len(self.entities)
 
-        self.entities[eid] = instance
+        self.register(instance)
 
         return instance
 
+    def register(self, instance):
+        self.entities[instance.eid] = instance
+        self.index.add(instance)
+
     def load(self, board: dict):
         from .Types import LootTable
         # Initialize a game with a board object
-        from .Types import Tile, LootTable, Card, Industry, Group
+        from .Types import Tile, BuyableTile, LootTable, Card, Industry, Group
         self.board = board
 
         def process_tile(data):
@@ -174,9 +280,39 @@ class Game():
         if count != 4 * (dim - 1):
             raise ValueError(f"Incorrect number of tiles {count} for board dimension of {dim}.")
 
-    def add_player(self, name: str, balance=0, position=0, data={}):
+        self.positions = {tile.eid: i for i, tile in enumerate(self.tiles)}
+        self.tables = {}
+
+        # Sorted positions of the tiles that do something when passed
+        self.passes = [
+            i for i, tile in enumerate(self.tiles)
+            if "pass" in tile.programs or type(tile).on_pass is not Tile.on_pass
+        ]
+
+        # Positions of the buyable tiles, the only tiles copied by instantiate and fork
+        self.buyables = [i for i, tile in enumerate(self.tiles) if isinstance(tile, BuyableTile)]
+
+    def passed(self, initial: int, distance: int):
+        # Positions in self.passes strictly between initial and initial + distance, in move order
+        m = len(self.tiles)
+        start = bisect_left(self.passes, initial + 1)
+        end = initial + distance
+
+        if end <= m:
+            return self.passes[start:bisect_left(self.passes, end)]
+
+        return self.passes[start:] + self.passes[:bisect_left(self.passes, end - m)]
+
+    def position(self, tile):
+        # Index of a tile on the board
+        return self.positions[tile.eid]
+
+    def add_player(self, name: str, balance=0, position=0, data=None):
         from .Types import Player
 
+        if data is None:
+            data = {}
+
         if "jailed" not in data:
             data["jailed"] = False
 
@@ -191,6 +327,154 @@ class Game():
 
         return player
 
+    def state(self):
+        # Compact, JSON serializable state of everything that changes during a game
+        # Players are [name, data, balance, position, debts, jailed, parked] by eid,
+        #   buyable tiles are [owner eid, level] by position, open trades as Trade.state
+        from .Types import BuyableTile
+
+        def eid(player):
+            return player.eid if player else None
+
+        return {
+            "board": self.source,
+            "rng": self.rng.state(),
+            "decks": {eid: [list(cards), remaining] for eid, (cards, remaining) in self.decks.items()},
+            "options": dict(self.options),
+            "turn": self.turn,
+            "active": self.active,
+            "order": list(self.order),
+            "players": {
+                player.eid: [
+                    player.name,
+                    dict(player.data),
+                    player.balance,
+                    player.position,
+                    [[eid(creditor), amount] for creditor, amount in player.debts],
+                    self.jailed.get(player),
+                    self.parked.get(player)
+                ]
+                for player in self.players.values()
+            },
+            "tiles": {
+                str(position): [eid(tile.owner), getattr(tile, "level", 0)]
+                for position, tile in enumerate(self.tiles)
+                if isinstance(tile, BuyableTile)
+            },
+            "trades": [trade.state() for trade in self.trades]
+        }
+
+    def restore(self, state: dict):
+        # Restore a game from its state, on a fresh Game
+        from .Types import Player
+
+        if not state["board"]:
+            raise ValueError("[Game] cannot restore a game that was not loaded from a board file")
+
+        self.load_from_file(state["board"])
+        self.options.update(state["options"])
+
+        if "rng" in state:
+            self.rng = Stream.restore(state["rng"])
+
+        self.decks = {eid: [list(cards), remaining] for eid, (cards, remaining) in state.get("decks", {}).items()}
+
+        for eid, (name, data, balance, position, _, jailed, parked) in state["players"].items():
+            player = Player(name, data, balance, position)
+            player.eid = eid
+            player.id = len(self.entities)
+            self.register(player)
+
+            self.players[eid] = player
+
+            if jailed is not None:
+                self.jailed[player] = jailed
+
+            if parked is not None:
+                self.parked[player] = parked
+
+        for eid, (*_, debts, _, _) in state["players"].items():
+            for creditor, amount in debts:
+                self.players[eid].debts.owe(self.players[creditor] if creditor else None, amount)
+
+        for position, (owner, level) in state["tiles"].items():
+            tile = self.tiles[int(position)]
+            tile.owner = self.players[owner] if owner else None
+
+            if hasattr(tile, "level"):
+                tile.level = level
+
+        for trade_id, seller, buyer, give, take, cash in state.get("trades", ()):
+            self.trades.add(Trade(seller, buyer, give, take, cash, trade_id))
+
+        self.order = list(state["order"])
+        self.active = state["active"]
+        self.turn = state["turn"]
+
+        return self
+
+    def fork(self):
+        """
+        Copy of the game that plays on independently, e.g. for rollouts, undo
+        or previews, in place of a deepcopy or a state round trip.
+
+        The board and immutable entities are shared as with instantiate, only
+        players, buyable tiles, the index, decks, the random stream and turn
+        state are copied. References to players (owners, creditors, jail and
+        park counters) point to the copies. Handlers added to the events of
+        this game (e.g. a StateTracker) are not carried over.
+
+        Tiles hold their own owner and level, so every buyable tile is copied:
+        a fork costs tens of microseconds on the default board, mostly in these
+        copies, and grows with the number of buyable tiles and players.
+        """
+        from .Ledger import Ledger
+
+        game = Game(self.rng.seed)
+        game.rng = self.rng.fork()
+        game.options = dict(self.options)
+        game.decks = {eid: [list(cards), remaining] for eid, (cards, remaining) in self.decks.items()}
+        game.trades = self.trades.copy()
+        game.order = list(self.order)
+        game.active = self.active
+        game.turn = self.turn
+        game.source = self.source
+
+        players = {}
+        for eid, player in self.players.items():
+            clone = players[eid] = player.copy()
+            clone.data = dict(player.data)
+
+        for clone in players.values():
+            clone.debts = Ledger((players[creditor.eid] if creditor else None, amount) for creditor, amount in clone.debts)
+
+        game.players = players
+        game.jailed = {players[player.eid]: turns for player, turns in self.jailed.items()}
+        game.parked = {players[player.eid]: turns for player, turns in self.parked.items()}
+        game.entities = {**self.entities, **players}
+
+        if not hasattr(self, "tiles"):
+            game.index = self.index.fork(game.entities)
+
+            return game
+
+        for field in ("board", "lootTables", "cards", "industries", "groups", "positions", "passes", "buyables", "tables"):
+            setattr(game, field, getattr(self, field))
+
+        # Owners are set on the slot, the forked index already counts them
+        game.index = index = self.index.fork(game.entities)
+        game.tiles = tiles = list(self.tiles)
+
+        for position in self.buyables:
+            clone = tiles[position] = tiles[position].copy(index)
+
+            if (owner := clone._owner) is not None:
+                clone._owner = players[owner.eid]
+
+            game.entities[clone.eid] = clone
+
+        return game
+
     @staticmethod
     def access(path: str | list, obj: dict, default=None):
         if isinstance(path, str):
@@ -203,87 +487,93 @@ class Game():
         return reduce(operator.getitem, path, obj)
 
     def select(self, selectors: dict):
-        def predicate(eid):
-            entity = self.entities[eid]
-            className = entity.__class__.__name__
-
-            if className not in selectors:
-                return False
-
-            if not (selector := selectors[className]):
-                return True
-
-            for field, relation in selector.items():
-                field, *path = field.split('.')
-                lhs = getattr(entity, field, None)
-
-                if lhs is None:
-                    return False
-
-                if path:
-                    lhs = Game.access(path, lhs, lhs)
-
-                op, rhs = relation
-
-                try:
-                    lhs = int(lhs)
-                    rhs = int(rhs)
-
-                    match op:
-                        case "=" | "==":
-                            return lhs == rhs
-                        case ">=":
-                            return lhs >= rhs
-                        case "<=":
-                            return lhs <= rhs
-                        case ">":
-                            return lhs > rhs
-                        case "<":
-                            return lhs < rhs
-                        case "!=":
-                            return lhs != rhs
-
-                    return False
-                except ValueError:
-                    match op:
-                        case "=" | "==":
-                            return lhs == rhs
-                        case "!=":
-                            return lhs != rhs
-                        case _:
-                            return False
-
-        entities = [self.entities[eid] for eid in self.entities if predicate(eid)]
-
-        if len(entities):
-            return entities
+        # Entities matching any of the selectors, in creation order, or None
+        return self.index.select(selectors)
+
+    def nearest_table(self, selectors: dict):
+        # Precomputed (near, next) arrays giving, for every board position, the
+        #   position of the nearest tile matching the selectors in either
+        #   direction and in the forward direction respectively.
+        # Only built for selectors whose result cannot change during the game,
+        #   i.e. selecting tiles by attributes that are not indexed (mutable).
+        key = Selector.key(selectors)
+
+        if key in self.tables:
+            return self.tables[key]
+
+        types = set(cls.__name__ for tile in self.tiles for cls in type(tile).__mro__)
+        fields = set(field.split(".")[0] for attrs in selectors.values() if attrs for field in attrs)
+
+        table = None
+        if all(name in types for name in selectors) and not (fields & indexed.names):
+            positions = set(self.position(tile) for tile in self.select(selectors) or [])
+            m = len(self.tiles)
 
-        return None
+            # Nearest matching position at or after (ahead) and at or before (behind)
+            #   every position, in two sweeps around the board
+            ahead, behind = [None] * m, [None] * m
+            found = None
+            for i in range(2 * m - 1, -1, -1):
+                if i % m in positions:
+                    found = i % m
+
+                ahead[i % m] = found
+
+            found = None
+            for i in range(2 * m):
+                if i % m in positions:
+                    found = i % m
+
+                behind[i % m] = found
+
+            # The nearest in either direction is the closer of the two, ties resolve
+            #   to the first in board order
+            near = [None] * m
+            for position, (a, b) in enumerate(zip(ahead, behind)):
+                if a is None:
+                    continue
+
+                forward, backward = self.distance(position, a), self.distance(b, position)
+                near[position] = a if forward < backward else b if backward < forward else min(a, b)
+
+            table = (near, ahead)
+
+        self.tables[key] = table
+
+        return table
 
     def nearest(self, selectors: dict, position: int, forward=True):
         # Get the nearest tile to a given position matching a selector
-        # Returns a tuple of (position, eid) where position is the index
-        #   of the entity inside the tiles list, and eid is the entity id.
+        # Returns a tuple of (position, tile) where position is the index
+        #   of the tile inside the tiles list.
+        if table := self.nearest_table(selectors):
+            near, ahead = table
+            nearest = (ahead if forward else near)[position]
+
+            if nearest is None:
+                return None
+
+            return (nearest, self.tiles[nearest])
+
         tiles = self.select(selectors)
 
         if not tiles:
             return None
 
         metric = self.distance if forward else self.distance2
-        positions = [self.tiles.index(tile) for tile in tiles]
+        positions = [self.position(tile) for tile in tiles]
         distances = [metric(position, pos) for pos in positions]
 
         nearest = positions[distances.index(min(distances))]
 
         return (nearest, self.tiles[nearest])
 
-
     def random(self, selectors: dict):
         # Find all tiles matching the provided selectors, then choose one at random
         entities = self.select(selectors)
 
         if isinstance(entities, list):
-            return choice(entities)
+            return self.rng.choice(entities)
 
         return None
 
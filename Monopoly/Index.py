@@ -0,0 +1,262 @@
+from functools import lru_cache
+
+class indexed:
+    """
+    Data descriptor for entity attributes that are indexed but mutable
+    (e.g. a tile's owner or level).
+
+    Writes are forwarded to the EntityIndex the entity belongs to, if any,
+    so that selectors on the attribute stay correct without rescanning.
+    """
+    # Names of every attribute declared as indexed, i.e. that can change in a game
+    names = set()
+
+    def __set_name__(self, owner, name):
+        self.name = name
+        self.slot = f"_{name}"
+
+        indexed.names.add(name)
+
+    def __get__(self, instance, owner=None):
+        if instance is None:
+            return self
+
+        return getattr(instance, self.slot)
+
+    def __set__(self, instance, value):
+        old = getattr(instance, self.slot, None)
+        setattr(instance, self.slot, value)
+
+        if index := getattr(instance, "_index", None):
+            index.update(instance, self.name, old, value)
+
+def key(value):
+    # Normalize attribute values the same way selectors compare them,
+    #   entities by their eid and numeric values as integers
+    if (eid := getattr(value, "eid", None)) is not None:
+        return eid
+
+    if isinstance(value, str):
+        return number(value)
+
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return value
+
+@lru_cache(maxsize=4096)
+def number(string):
+    try:
+        return int(string)
+    except ValueError:
+        return string
+
+def compare(lhs, op, rhs):
+    try:
+        lhs = int(lhs)
+        rhs = int(rhs)
+
+        match op:
+            case "=" | "==":
+                return lhs == rhs
+            case ">=":
+                return lhs >= rhs
+            case "<=":
+                return lhs <= rhs
+            case ">":
+                return lhs > rhs
+            case "<":
+                return lhs < rhs
+            case "!=":
+                return lhs != rhs
+
+        return False
+    except (TypeError, ValueError):
+        lhs = key(lhs)
+
+        match op:
+            case "=" | "==":
+                return lhs == rhs
+            case "!=":
+                return lhs != rhs
+            case _:
+                return False
+
+def matches(entity, selector):
+    from .Game import Game
+
+    for field, relation in selector.items():
+        field, *path = field.split('.')
+        lhs = getattr(entity, field, None)
+
+        if lhs is None:
+            return False
+
+        if path:
+            lhs = Game.access(path, lhs, lhs)
+
+        op, rhs = relation
+
+        if not compare(lhs, op, rhs):
+            return False
+
+    return True
+
+class EntityIndex:
+    """
+    Entities of a game by class (including base classes) and by the value of
+    attributes that selectors commonly filter on by equality.
+
+    Buckets map eid -> id and are resolved through the game's entities, so an
+    index can be forked for another game sharing the same entities (see
+    Game.instantiate). Buckets are copied before being written to, forks only
+    copy the buckets of mutable (indexed) attributes up front.
+
+    Entities with a group are also counted per group, per (group, owner) and
+    per (group, level), so monopolies and the even-build rule are O(1) checks.
+    """
+    fields = ("label", "group", "industry", "owner", "level")
+
+    def __init__(self, entities: dict):
+        self.entities = entities
+        self.classes = {}
+        self.attrs = {field: {} for field in EntityIndex.fields}
+
+        # group -> number of entities, (group, owner) -> owned, group -> {level: count}
+        self.sizes = {}
+        self.holdings = {}
+        self.levels = {}
+
+    def fork(self, entities: dict):
+        index = object.__new__(EntityIndex)
+        index.entities = entities
+        index.classes = dict(self.classes)
+        index.attrs = {
+            field: ({value: dict(bucket) for value, bucket in buckets.items()} if field in indexed.names else dict(buckets))
+            for field, buckets in self.attrs.items()
+        }
+        index.sizes = self.sizes
+        index.holdings = dict(self.holdings)
+        index.levels = {group: dict(levels) for group, levels in self.levels.items()}
+
+        return index
+
+    @staticmethod
+    def insert(buckets, name, eid, id):
+        # Copy on write, buckets may be shared with other indexes
+        bucket = dict(buckets.get(name, ()))
+        bucket[eid] = id
+        buckets[name] = bucket
+
+    def add(self, entity):
+        eid = entity.eid
+
+        # Register under every class in the MRO so selectors include subclasses
+        for cls in type(entity).__mro__:
+            if cls.__name__ in ("Entity", "object"):
+                continue
+
+            EntityIndex.insert(self.classes, cls.__name__, eid, entity.id)
+
+        for field in EntityIndex.fields:
+            if (value := getattr(entity, field, None)) is not None:
+                EntityIndex.insert(self.attrs[field], key(value), eid, entity.id)
+
+        if (group := getattr(entity, "group", None)) is not None:
+            self.sizes[group] = self.sizes.get(group, 0) + 1
+            self.count(entity, "owner", None, getattr(entity, "owner", None))
+            self.count(entity, "level", None, getattr(entity, "level", 0))
+
+        self.bind(entity)
+
+    def bind(self, entity):
+        # Only entities with indexed attributes keep a reference to the index,
+        #   entities shared between games (see Game.instantiate) have none
+        if EntityIndex.mutable(type(entity)):
+            entity._index = self
+
+    @staticmethod
+    @lru_cache(maxsize=None)
+    def mutable(cls):
+        return any(isinstance(getattr(cls, name, None), indexed) for name in indexed.names)
+
+    def count(self, entity, field, old, new):
+        # Moves a grouped entity between (group, owner) or (group, level) counts
+        group = entity.group
+
+        if field == "owner":
+            counts, old, new = self.holdings, (group, key(old)), (group, key(new))
+        elif field == "level":
+            counts = self.levels.setdefault(group, {})
+        else:
+            return
+
+        if old in counts:
+            counts[old] -= 1
+
+            if not counts[old]:
+                del counts[old]
+
+        counts[new] = counts.get(new, 0) + 1
+
+    def monopoly(self, group, owner):
+        # Whether owner holds every entity of the group
+        return owner is not None and self.holdings.get((group, key(owner)), 0) == self.sizes.get(group)
+
+    def lowest(self, group):
+        # Lowest level in the group, levels are few so this does not depend on the board size
+        return min(self.levels.get(group) or (0,))
+
+    def update(self, entity, field, old, new):
+        if getattr(entity, "group", None) is not None:
+            self.count(entity, field, old, new)
+
+        if field not in self.attrs:
+            return
+
+        buckets = self.attrs[field]
+
+        if old is not None and (bucket := buckets.get(key(old))):
+            bucket.pop(entity.eid, None)
+
+        if new is not None:
+            buckets.setdefault(key(new), {})[entity.eid] = entity.id
+
+    def candidates(self, name, selector):
+        eids = self.classes.get(name)
+
+        if not eids or not selector:
+            return eids or {}
+
+        # Use the smallest indexed equality bucket, falling back to the class
+        best = eids
+        for field, (op, rhs) in selector.items():
+            if field not in self.attrs or op not in ("=", "=="):
+                continue
+
+            bucket = self.attrs[field].get(key(rhs), {})
+
+            if len(bucket) < len(best):
+                best = bucket
+
+        if best is eids:
+            return eids
+
+        return {eid: id for eid, id in best.items() if eid in eids}
+
+    def select(self, selectors: dict):
+        found = {}
+
+        for name, selector in selectors.items():
+            for eid, id in self.candidates(name, selector).items():
+                entity = self.entities[eid]
+
+                if not selector or matches(entity, selector):
+                    found[eid] = id
+
+        entities = [self.entities[eid] for eid in sorted(found, key=found.get)]
+
+        if len(entities):
+            return entities
+
+        return None
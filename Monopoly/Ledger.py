@@ -0,0 +1,109 @@
+class Ledger:
+    """
+    Debts a player owes, by creditor (None is the bank).
+
+    Debts to the same creditor are merged and creditors are repaid in the
+    order they were first owed. Repaying pops settled creditors off the front,
+    so a repayment is amortized O(1) however many debts were incurred.
+
+    Iterates as (creditor, amount) pairs.
+    """
+    __slots__ = ("debts", "total")
+
+    def __init__(self, debts=()):
+        # Dicts keep insertion order, the first key is the oldest creditor
+        self.debts = {}
+        self.total = 0
+
+        for creditor, amount in debts:
+            self.owe(creditor, amount)
+
+    def __iter__(self):
+        return iter(self.debts.items())
+
+    def __len__(self):
+        return len(self.debts)
+
+    def __repr__(self):
+        return f"Ledger({list(self)})"
+
+    def owe(self, creditor, amount):
+        if amount <= 0:
+            return
+
+        self.debts[creditor] = self.debts.get(creditor, 0) + amount
+        self.total += amount
+
+    def owed(self, creditor):
+        return self.debts.get(creditor, 0)
+
+    def forgive(self, creditor):
+        # Drops the debt to a creditor, returns its amount
+        amount = self.debts.pop(creditor, 0)
+        self.total -= amount
+
+        return amount
+
+    def repay(self, amount):
+        # Repays creditors oldest first with up to amount
+        # Returns [(creditor, paid)] in repayment order
+        paid = []
+
+        while amount > 0 and self.debts:
+            creditor = next(iter(self.debts))
+            debt = self.debts[creditor]
+
+            if amount < debt:
+                self.debts[creditor] = debt - amount
+                paid.append((creditor, amount))
+                self.total -= amount
+
+                break
+
+            del self.debts[creditor]
+            paid.append((creditor, debt))
+            self.total -= debt
+            amount -= debt
+
+        return paid
+
+    @staticmethod
+    def net(players):
+        # Collapses debts between players into at most one debt per net debtor,
+        #   cancelling circular debts. Debts to the bank are left untouched.
+        # A player whose debts to others are cancelled has been repaid by them,
+        #   returns {player: amount repaid to them}
+        players = list(players)
+        members = set(players)
+        position = {player: 0 for player in players}
+        owed = {player: 0 for player in players}
+
+        for debtor in players:
+            for creditor, amount in list(debtor.debts):
+                if creditor not in members:
+                    continue
+
+                debtor.debts.forgive(creditor)
+                position[debtor] -= amount
+                position[creditor] += amount
+                owed[creditor] += amount
+
+        debtors = [[player, -value] for player, value in position.items() if value < 0]
+        creditors = [[player, value] for player, value in position.items() if value > 0]
+
+        # Net debtors owe net creditors what is left after cancelling, in turn order
+        i = 0
+        for creditor in creditors:
+            while creditor[1] > 0:
+                debtor = debtors[i]
+                amount = min(debtor[1], creditor[1])
+
+                debtor[0].debts.owe(creditor[0], amount)
+                owed[creditor[0]] -= amount
+                debtor[1] -= amount
+                creditor[1] -= amount
+
+                if debtor[1] == 0:
+                    i += 1
+
+        return {player: amount for player, amount in owed.items() if amount}
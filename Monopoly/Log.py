@@ -0,0 +1,100 @@
+"""
+Structured game log.
+
+Records carry a %-style message and its arguments plus a dict of fields. Call
+sites only pass plain values (names, ids, amounts), so the message is formatted
+later, on the listener thread that writes the queued records.
+
+Nothing is written until setup() is called, and disable() turns logging off
+entirely, e.g. for simulations, where a call costs a level check. disabled()
+does the same within a block only.
+"""
+import sys
+import json
+import queue
+import atexit
+from contextlib import contextmanager
+import logging
+from logging.handlers import QueueHandler, QueueListener
+
+logger = logging.getLogger("monopoly")
+logger.addHandler(logging.NullHandler())
+logger.propagate = False
+
+listener = None
+
+class DeferredQueueHandler(QueueHandler):
+    # Records are queued as is, QueueHandler would format them on the calling thread
+    def prepare(self, record):
+        return record
+
+class StructuredFormatter(logging.Formatter):
+    # One JSON object per line with the time, level, message and fields
+    def format(self, record):
+        entry = {
+            "time": round(record.created, 6),
+            "level": record.levelname.lower(),
+            "message": record.getMessage()
+        }
+        entry.update(getattr(record, "fields", {}))
+
+        return json.dumps(entry, default=str)
+
+def log(level: int, message: str, *args, **fields):
+    if logger.isEnabledFor(level):
+        logger.log(level, message, *args, extra={"fields": fields})
+
+def debug(message: str, *args, **fields):
+    log(logging.DEBUG, message, *args, **fields)
+
+def info(message: str, *args, **fields):
+    log(logging.INFO, message, *args, **fields)
+
+def warning(message: str, *args, **fields):
+    log(logging.WARNING, message, *args, **fields)
+
+def setup(level: int | str=logging.INFO, stream=None, structured: bool=True):
+    # Writes records at or above level to stream (stdout by default) from a background thread
+    global listener
+
+    stop()
+
+    handler = logging.StreamHandler(stream or sys.stdout)
+    handler.setFormatter(StructuredFormatter() if structured else logging.Formatter("%(message)s"))
+
+    records = queue.SimpleQueue()
+    listener = QueueListener(records, handler)
+    listener.start()
+
+    for existing in list(logger.handlers):
+        logger.removeHandler(existing)
+
+    logger.addHandler(DeferredQueueHandler(records))
+    logger.setLevel(level)
+    logger.disabled = False
+
+def disable():
+    logger.disabled = True
+    logger.setLevel(logging.CRITICAL + 1)
+
+@contextmanager
+def disabled():
+    # Disables logging within the block, then restores the previous state
+    state = logger.disabled, logger.level
+    disable()
+
+    try:
+        yield
+    finally:
+        logger.disabled = state[0]
+        logger.setLevel(state[1])
+
+def stop():
+    # Writes out queued records and stops the listener thread
+    global listener
+
+    if listener is not None:
+        listener.stop()
+        listener = None
+
+atexit.register(stop)
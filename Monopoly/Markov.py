@@ -0,0 +1,225 @@
+import copy
+from collections import ChainMap
+
+import numpy as np
+
+from .Game import Game
+from .Monoscript import Monoscript, Selector
+from .Types import ChestTile
+
+class MarkovChain:
+    """
+    Long-run landing probabilities of a board, computed from its transition matrix.
+
+    The state is the position of a player at the end of a turn. A turn rolls
+    n s-sided dice, lands on a tile, then applies the movement effects of the
+    tile's land script or of the cards its loot table draws (move ... to,
+    move ... near/next and jail), including landings chained through those moves.
+
+    Example:
+        chain = MarkovChain.from_board(board)
+        for tile, p in chain.probabilities():
+            ...
+    """
+    # Depth at which chained card moves stop being followed
+    depth = 8
+
+    def __init__(self, game: Game, n: int=2, s: int=6):
+        self.game = game
+        self.m = len(game.tiles)
+
+        jail = game.select(Selector.parse("Tile[label=Jail]"))
+        self.jail = game.position(jail[0]) if jail else None
+
+        self.dice = MarkovChain.dice(n, s)
+        self.roll = self.build_roll()
+        self.effects, self.visits = self.build_effects()
+        self.transition = self.roll @ self.effects
+
+    @staticmethod
+    def from_board(board: dict, n: int=2, s: int=6):
+        # Loading a game mutates the board, keep the caller's copy intact
+        game = Game()
+        game.load(copy.deepcopy(board))
+
+        return MarkovChain(game, n, s)
+
+    @staticmethod
+    def dice(n: int, s: int):
+        # Distribution of the sum of n s-sided dice, indexed by the sum
+        face = np.ones(s) / s
+        dist = np.array([1.0])
+
+        for _ in range(n):
+            dist = np.convolve(dist, face)
+
+        return np.concatenate([np.zeros(n), dist])
+
+    def build_roll(self):
+        # roll[p, q] is the probability that a roll from p lands on q
+        sums = np.nonzero(self.dice)[0]
+        rows = np.repeat(np.arange(self.m), len(sums))
+        cols = (rows + np.tile(sums, self.m)) % self.m
+
+        roll = np.zeros((self.m, self.m))
+        np.add.at(roll, (rows, cols), np.tile(self.dice[sums], self.m))
+
+        return roll
+
+    def build_effects(self):
+        # effects[q, r] is the probability of ending the turn on r after landing on q
+        # visits[q, r] is the expected number of landings on r after landing on q
+        effects = np.zeros((self.m, self.m))
+        visits = np.zeros((self.m, self.m))
+        memo = {}
+
+        for q in range(self.m):
+            final, landed = self.land(q, memo, ())
+
+            for r, p in final.items():
+                effects[q, r] += p
+
+            for r, p in landed.items():
+                visits[q, r] += p
+
+        return effects, visits
+
+    def land(self, q, memo, stack):
+        # Returns ({final position: probability}, {tile landed on: expected landings})
+        if q in memo:
+            return memo[q]
+
+        if q in stack or len(stack) >= MarkovChain.depth:
+            return {q: 1.0}, {q: 1.0}
+
+        stack = stack + (q,)
+        final, landed = {}, {q: 1.0}
+
+        for program, weight in self.programs(self.game.tiles[q]):
+            for r, p, moved in self.execute(program, q):
+                if not moved:
+                    final[r] = final.get(r, 0.0) + weight * p
+                    continue
+
+                chained, visits = self.land(r, memo, stack)
+
+                for t, pt in chained.items():
+                    final[t] = final.get(t, 0.0) + weight * p * pt
+
+                for t, pt in visits.items():
+                    landed[t] = landed.get(t, 0.0) + weight * p * pt
+
+        memo[q] = final, landed
+
+        return final, landed
+
+    def programs(self, tile):
+        # Scripts that run when landing on a tile, with their probability
+        if isinstance(tile, ChestTile):
+            table = tile.table.data
+            total = sum(table["weights"])
+
+            return [
+                (self.game.cards[card].program, weight / total)
+                for card, weight in zip(table["cards"], table["weights"])
+            ]
+
+        return [(tile.programs.get("land", ()), 1.0)]
+
+    def execute(self, program, q):
+        # Movement effects of a compiled program run from position q
+        # Yields (position, probability, moved) where moved means the position
+        #   was reached through a move, so it is landed on (jail does not land)
+        dist = {q: (1.0, False)}
+        variables = {}
+
+        for instruction in program:
+            handler = instruction.handler
+
+            if instruction.target:
+                if handler is Monoscript.opcodes["random"]:
+                    selectors = {}
+                    for arg in instruction.args[1:]:
+                        selectors = selectors | Selector.resolve(arg)
+
+                    variables[instruction.target] = [self.game.position(tile) for tile in self.game.select(selectors) or []]
+
+                continue
+
+            if handler is Monoscript.opcodes["jail"] and self.jail is not None:
+                dist = {self.jail: (1.0, False)}
+
+            elif handler is Monoscript.opcodes["move"]:
+                moved = {}
+
+                for position, (p, _) in dist.items():
+                    for r, pr in self.move(instruction, position, variables).items():
+                        previous = moved.get(r, (0.0, True))[0]
+                        moved[r] = (previous + p * pr, True)
+
+                dist = moved
+
+        for r, (p, moved) in dist.items():
+            yield r, p, moved
+
+    def move(self, instruction, position, variables):
+        # Destinations {position: probability} of a move instruction from position
+        args = list(instruction.args)
+        slots = {index: name for index, name, *_ in instruction.slots}
+
+        mode, *rest = args[2:]
+        if mode == "instant":
+            mode, *rest = rest
+
+        if not rest:
+            return {position: 1.0}
+
+        match mode:
+            case "to":
+                index = len(args) - len(rest)
+
+                if index in slots:
+                    targets = variables.get(slots[index])
+
+                    if not targets:
+                        return {position: 1.0}
+
+                    return {r: targets.count(r) / len(targets) for r in targets}
+
+                tiles = self.game.select(Selector.resolve(rest[0]))
+
+                if not tiles:
+                    return {position: 1.0}
+
+                return {self.game.position(tiles[0]): 1.0}
+
+            case "near" | "next":
+                selectors = ChainMap(*[Selector.resolve(token) for token in rest])
+                tile = self.game.nearest(selectors, position, mode == "next")
+
+                if not tile:
+                    return {position: 1.0}
+
+                return {tile[0]: 1.0}
+
+        return {position: 1.0}
+
+    def steady_state(self):
+        # Stationary distribution pi of the end of turn positions, pi T = pi
+        A = self.transition.T - np.eye(self.m)
+        A[-1, :] = 1.0
+
+        b = np.zeros(self.m)
+        b[-1] = 1.0
+
+        return np.linalg.solve(A, b)
+
+    def landing(self):
+        # Expected landings on each tile per turn in the long run, normalized to sum to 1
+        landings = self.steady_state() @ self.roll @ self.visits
+
+        return landings / landings.sum()
+
+    def probabilities(self):
+        # Long-run landing probability per tile, as (tile, probability) in board order
+        return list(zip(self.game.tiles, self.landing().tolist()))
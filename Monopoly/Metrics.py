@@ -0,0 +1,84 @@
+import threading
+
+class Metrics:
+    """
+    Timings of the game engine, rendered in the Prometheus text format.
+
+    Every summary keeps the count and total seconds of the calls observed, by
+    label values. Only one call in round(1 / rate) is timed, so the overhead
+    can be kept low under load. Sums and counts only cover the timed calls:
+    their ratio estimates the average, and a count divided by the exported
+    monopoly_metrics_sample_rate estimates the total number of calls (_count
+    is not exact). A rate of 0 disables timing.
+
+    Updates are not locked, a concurrent update may rarely be lost.
+    """
+    help = {
+        "monopoly_event_seconds": "Time dispatching an event to all of its handlers, by event type.",
+        "monopoly_handler_seconds": "Time spent in an event handler, by event type and handler.",
+        "monopoly_opcode_seconds": "Time executing a Monoscript instruction, by opcode.",
+        "monopoly_card_seconds": "Time executing a card, by card text.",
+        "monopoly_request_seconds": "Latency of API requests, by endpoint, method and status."
+    }
+
+    def __init__(self, rate: float=1.0):
+        self.summaries = {name: {} for name in Metrics.help}
+        self.tick = 0
+        self.lock = threading.Lock()
+
+        self.configure(rate)
+
+    def configure(self, rate: float):
+        # Fraction of calls to time, 0 disables timing
+        self.rate = rate
+        self.every = round(1 / rate) if rate > 0 else 0
+
+    def sample(self):
+        if not self.every:
+            return False
+
+        self.tick += 1
+
+        return self.tick % self.every == 0
+
+    def observe(self, name: str, labels: tuple, seconds: float):
+        summary = self.summaries[name]
+
+        if (entry := summary.get(labels)) is None:
+            entry = summary[labels] = [0, 0.0]
+
+        entry[0] += 1
+        entry[1] += seconds
+
+    def reset(self):
+        with self.lock:
+            self.summaries = {name: {} for name in Metrics.help}
+
+    @staticmethod
+    def escape(value):
+        return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+    def render(self):
+        lines = [
+            "# HELP monopoly_metrics_sample_rate Fraction of calls timed, divide counts by it to estimate totals.",
+            "# TYPE monopoly_metrics_sample_rate gauge",
+            f"monopoly_metrics_sample_rate {1 / self.every if self.every else 0}"
+        ]
+
+        with self.lock:
+            summaries = {name: dict(summary) for name, summary in self.summaries.items()}
+
+        for name, summary in summaries.items():
+            lines.append(f"# HELP {name} {Metrics.help[name]}")
+            lines.append(f"# TYPE {name} summary")
+
+            for labels, (count, seconds) in sorted(summary.items()):
+                labels = ",".join(f"{key}=\"{Metrics.escape(value)}\"" for key, value in labels)
+
+                lines.append(f"{name}_count{{{labels}}} {count}")
+                lines.append(f"{name}_sum{{{labels}}} {seconds:.9f}")
+
+        return "\n".join(lines) + "\n"
+
+# Process-wide metrics, disabled until configured (see app.py)
+metrics = Metrics(0)
@@ -1,5 +1,11 @@
 import re
+import operator
+from time import perf_counter
 from collections import ChainMap
+from functools import lru_cache, reduce
+
+from . import Log
+from .Metrics import metrics
 
 class Selector:
     @staticmethod
@@ -46,9 +52,68 @@ class Selector:
 
         return { type: attrs }
 
-class Monoscript:
-    keywords = ["balance", "move", "jail", "random", "log", "transaction", "park"]
+    @staticmethod
+    def resolve(selector):
+        # Selectors are parsed when a script is compiled, but may still be raw strings
+        if isinstance(selector, dict):
+            return selector
+
+        return Selector.parse(selector)
+
+    @staticmethod
+    def key(selectors):
+        # Hashable form of parsed selectors, used to memoize lookups
+        return tuple(
+            (type, tuple((field, tuple(relation)) for field, relation in attrs.items()) if attrs else None)
+            for type, attrs in selectors.items()
+        )
+
+class Instruction:
+    """
+    Compiled form of a single Monoscript statement (or card text template).
+
+    handler is the resolved opcode, or None for literal values and templates.
+    args holds the statement tokens with literal selectors already parsed.
+    slots lists (index, name, field, path) for every $var binding in args.
+    target is the variable name for assignments of the form "var = ...".
+    """
+    __slots__ = ("handler", "args", "slots", "target")
+
+    def __init__(self, handler, args, slots, target=None):
+        self.handler = handler
+        self.args = args
+        self.slots = slots
+        self.target = target
+
+    def bind(self, game, context):
+        if not self.slots:
+            return self.args
+
+        args = list(self.args)
+
+        for index, name, field, path in self.slots:
+            if name not in context:
+                continue
+
+            value = context[name]
+            args[index] = value
+
+            if not value or field is None:
+                continue
+
+            if type(value) == str:
+                value = game.entities[value]
 
+            data = getattr(value, field, None)
+
+            if path:
+                data = reduce(operator.getitem, path, data)
+
+            args[index] = str(data)
+
+        return args
+
+class Monoscript:
     def __init__(self, game):
         from .Game import Game
 
@@ -60,8 +125,11 @@ class Monoscript:
 
     def balance(self, args, context={}):
         from .Types import Player
+        from .Event import PlayerBalanceUpdated
 
-        mode, eid, amount = args[1:]
+        # The player may be omitted, e.g. "balance sub 10%", in which case it is the context's
+        mode, *rest = args[1:]
+        eid, amount = rest if len(rest) == 2 else (context.get("player"), *rest)
 
         player: Player
         if isinstance(eid, Player):
@@ -85,6 +153,7 @@ class Monoscript:
             raise ValueError(f"[Monoscript]: move unknown mode {mode!r}")
 
         player.balance += int(delta)
+        self.game.events += PlayerBalanceUpdated(player, int(delta))
 
     def move(self, args, context={}):
         from .Types import Player
@@ -114,15 +183,14 @@ class Monoscript:
 
                 tile = rest[0]
 
-                if isinstance(tile, str):
-                    selector = Selector.parse(tile)
-                    tile = self.game.select(selector)[0]
+                if isinstance(tile, (str, dict)):
+                    tile = self.game.select(Selector.resolve(tile))[0]
 
                 if not isinstance(tile, Tile):
                     raise TypeError(f"[Monoscript]: (invalid type) invalid tile entity {tile!r}")
 
                 initial = player.position
-                player.position = self.game.tiles.index(tile)
+                player.position = self.game.position(tile)
                 self.game.events += PlayerMoveEvent(player, initial, player.position, instant)
 
             case "near" | "next":
@@ -131,7 +199,7 @@ class Monoscript:
                 if not rest:
                     raise ValueError(f"[Monoscript]: (too few args) expected tile selector")
 
-                selectors = ChainMap(*[Selector.parse(token) for token in rest])
+                selectors = ChainMap(*[Selector.resolve(token) for token in rest])
 
                 forward = (mode == "next")
                 tile = self.game.nearest(selectors, player.position, forward)
@@ -148,7 +216,7 @@ class Monoscript:
     def park(self, args, context={}):
         from .Types import Player
 
-        eid = args[1]
+        eid = args[1] if len(args) > 1 else context.get("player")
         player: Player
         if isinstance(eid, Player):
             player = eid
@@ -162,7 +230,7 @@ class Monoscript:
     def jail(self, args, context={}):
         from .Types import Player
 
-        eid = args[1]
+        eid = args[1] if len(args) > 1 else context.get("player")
         player: Player
         if isinstance(eid, Player):
             player = eid
@@ -177,64 +245,138 @@ class Monoscript:
         selectors = {}
 
         for arg in args[1:]:
-            selectors = selectors | Selector.parse(arg)
+            selectors = selectors | Selector.resolve(arg)
 
         return self.game.random(selectors)
 
-    def assign(self, args, context={}):
-        varName = args[0]
-        rest = args[2:]
+    def log(self, args, context={}):
+        Log.info("%s", " ".join(map(str, args[1:])), event="script")
 
-        value = " ".join(map(str, rest))
-        if rest[0] in Monoscript.keywords:
-            value = getattr(self, rest[0])(rest)
+    opcodes = {
+        "balance": balance,
+        "move": move,
+        "park": park,
+        "jail": jail,
+        "random": random,
+        "log": log
+    }
 
-        context[varName] = value
+    @staticmethod
+    def compile(script):
+        # Compile a script (a statement or a list of statements) into a tuple of instructions
+        if isinstance(script, str):
+            script = [script]
 
-        return True
+        return tuple(Monoscript.compile_line(line) for line in script)
 
-    def bindTokens(self, tokens, context):
-        from .Game import Game
+    # Lines run through execute() are cached too, the bound keeps arbitrary
+    #   script text from growing the caches without limit
+    @staticmethod
+    @lru_cache(maxsize=4096)
+    def compile_line(line):
+        tokens = Monoscript.tokenize(line)
+
+        if not tokens:
+            raise ValueError(f"[Monoscript]: empty statement")
+
+        if tokens[0] in Monoscript.opcodes:
+            return Monoscript.compile_tokens(tokens)
+
+        # Anything that is not a keyword is an assignment "var = value"
+        if len(tokens) < 3:
+            raise ValueError(f"[Monoscript]: invalid statement {line!r}")
+
+        instruction = Monoscript.compile_tokens(tokens[2:])
+        instruction.target = tokens[0]
+
+        return instruction
+
+    @staticmethod
+    @lru_cache(maxsize=4096)
+    def compile_template(text):
+        # Card text templates are literal statements, only their $var slots are bound
+        return Monoscript.compile_tokens(Monoscript.tokenize(text), literal=True)
+
+    @staticmethod
+    def compile_tokens(tokens, literal=False):
+        args = list(tokens)
+        slots = []
 
         for i, token in enumerate(tokens):
             if not token.startswith('$'):
                 continue
 
-            varName = token[1:]
-            accessor = None
+            name = token[1:]
+            field = None
+            path = ()
 
-            if "[" in varName:
-                varName, accessor = re.findall("(\w+)\[(.+?)\]", varName)[0]
+            if "[" in name:
+                name, accessor = re.findall("(\w+)\[(.+?)\]", name)[0]
+                field, *path = accessor.split(".")
+                path = tuple(int(x) if x.isnumeric() else x for x in path)
 
-            if varName in context:
-                value = context[varName]
-                tokens[i] = value
+            slots.append((i, name, field, path))
 
-                if not value or not accessor:
-                    continue
+        opcode = None if literal else Monoscript.opcodes.get(tokens[0])
+        bound = set(slot[0] for slot in slots)
 
-                field, *path = accessor.split(".")
-                if type(value) == str:
-                    value = self.game.entities[value]
-                data = getattr(value, field, None)
-                data = str(Game.access(path, data, data))
+        # Parse literal selectors ahead of time so execution only does lookups
+        match tokens[0] if opcode else None:
+            case "move":
+                # move <player> [instant] <to|near|next> <selectors...>
+                start = 4 if tokens[2:3] == ["instant"] else 3
+            case "random":
+                start = 1
+            case _:
+                start = len(tokens)
 
-                tokens[i] = data
+        for i in range(start, len(tokens)):
+            if i not in bound:
+                args[i] = Selector.parse(tokens[i])
 
-    def log(self, args, context={}):
-        print(" ".join(map(str, args[1:])))
+        return Instruction(opcode, tuple(args), tuple(slots))
+
+    def run(self, program, context=None):
+        if context is None:
+            context = {}
+
+        if metrics.sample():
+            return self.timed(program, context)
+
+        for instruction in program:
+            args = instruction.bind(self.game, context)
+
+            if instruction.handler:
+                value = instruction.handler(self, args=args, context=context)
+            else:
+                value = " ".join(map(str, args))
+
+            if instruction.target:
+                context[instruction.target] = value
+
+        return context
+
+    def timed(self, program, context):
+        # run, recording the time of each instruction by opcode (assignments of text are "text")
+        for instruction in program:
+            start = perf_counter()
+            args = instruction.bind(self.game, context)
+
+            if instruction.handler:
+                value = instruction.handler(self, args=args, context=context)
+            else:
+                value = " ".join(map(str, args))
 
-    def execute(self, script, context={}):
-        if isinstance(script, list):
-            for line in script:
-                self.execute(line, context)
+            if instruction.target:
+                context[instruction.target] = value
 
-            return
+            opcode = instruction.handler.__name__ if instruction.handler else "text"
+            metrics.observe("monopoly_opcode_seconds", (("opcode", opcode),), perf_counter() - start)
 
-        tokens = Monoscript.tokenize(script)
-        self.bindTokens(tokens, context)
+        return context
 
-        handler = getattr(self, tokens[0], self.assign)
-        handler(args=tokens, context=context)
+    def render(self, template, context):
+        return " ".join(map(str, template.bind(self.game, context)))
 
-        return context
\ No newline at end of file
+    def execute(self, script, context=None):
+        return self.run(Monoscript.compile(script), context)
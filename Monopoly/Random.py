@@ -0,0 +1,134 @@
+import numpy as np
+
+class Stream:
+    """
+    Seeded random stream of a game.
+
+    Dice and uniform draws are generated `size` at a time into
+    buffers, one per kind of draw (e.g. per number and sides of dice), so a
+    draw is a list lookup rather than a generator call. The generator is only
+    used to refill buffers, so the seed and the order of the refills determine
+    every draw: state() records them and Stream.restore() replays them, which
+    restores a stream exactly without storing any buffer.
+
+    The generator is only created on the first refill, and fork() copies a
+    stream without copying its buffers (values are never written to).
+
+    Keys of buffers are tuples:
+        ("dice", n, s)  n s-sided dice
+        ("uniform",)    floats in [0, 1)
+    """
+    size = 1024
+
+    def __init__(self, seed: int=None):
+        if seed is None:
+            seed = np.random.SeedSequence().entropy
+
+        self.seed = seed
+        self.generator = None
+
+        # Bit generator state to resume from when the generator is created, see fork
+        self.resume = None
+
+        # key -> [values, index of the next value]
+        self.buffers = {}
+        self.refills = []
+
+    def generate(self, key):
+        if self.generator is None:
+            self.generator = np.random.default_rng(self.seed)
+
+            if self.resume is not None:
+                self.generator.bit_generator.state = self.resume
+
+        match key:
+            case ("dice", n, s):
+                return self.generator.integers(1, s + 1, size=(Stream.size, n)).tolist()
+
+            case ("uniform",):
+                return self.generator.random(Stream.size).tolist()
+
+        raise ValueError(f"[Stream] unknown draw {key!r}")
+
+    def buffer(self, key):
+        # Buffer of a kind of draw with values left, refilled if needed
+        buffer = self.buffers.get(key)
+
+        if buffer is None or buffer[1] == len(buffer[0]):
+            buffer = self.buffers[key] = [self.generate(key), 0]
+            self.refills.append(key)
+
+        return buffer
+
+    def draw(self, key):
+        buffer = self.buffer(key)
+
+        value = buffer[0][buffer[1]]
+        buffer[1] += 1
+
+        return value
+
+    def draws(self, key, k: int):
+        # k draws at once, as a list
+        values = []
+
+        while len(values) < k:
+            buffer = self.buffer(key)
+            end = min(len(buffer[0]), buffer[1] + k - len(values))
+
+            values.extend(buffer[0][buffer[1]:end])
+            buffer[1] = end
+
+        return values
+
+    def roll(self, n: int=2, s: int=6):
+        # Faces of n s-sided dice, as a list
+        return self.draw(("dice", n, s))
+
+    def uniform(self):
+        return self.draw(("uniform",))
+
+    def uniforms(self, k: int):
+        return self.draws(("uniform",), k)
+
+    def choice(self, sequence):
+        return sequence[int(self.uniform() * len(sequence))]
+
+    def shuffle(self, sequence: list):
+        # Fisher-Yates, in place
+        for i in range(len(sequence) - 1, 0, -1):
+            j = int(self.uniform() * (i + 1))
+            sequence[i], sequence[j] = sequence[j], sequence[i]
+
+    def fork(self):
+        # Copy continuing with the same draws, independently of this stream
+        stream = object.__new__(Stream)
+        stream.seed = self.seed
+        stream.generator = None
+        stream.resume = self.generator.bit_generator.state if self.generator is not None else self.resume
+        stream.buffers = {key: [values, index] for key, (values, index) in self.buffers.items()}
+        stream.refills = list(self.refills)
+
+        return stream
+
+    def state(self):
+        return {
+            "seed": self.seed,
+            "refills": [list(key) for key in self.refills],
+            "positions": [[list(key), buffer[1]] for key, buffer in self.buffers.items()]
+        }
+
+    @staticmethod
+    def restore(state: dict):
+        stream = Stream(state["seed"])
+
+        # Keys are stored as lists in JSON
+        for key in state["refills"]:
+            key = tuple(key)
+            stream.buffers[key] = [stream.generate(key), 0]
+            stream.refills.append(key)
+
+        for key, position in state["positions"]:
+            stream.buffers[tuple(key)][1] = position
+
+        return stream
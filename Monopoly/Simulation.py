@@ -0,0 +1,149 @@
+import os
+import copy
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+
+from . import Batch, Log
+from .Game import Game
+from .Event import PlayerBalanceUpdated
+from .Types import BuyableTile, PropertyTile
+
+# Strategies decide whether a player buys an unowned tile or upgrades their
+#   own property after landing on it
+def never(game, player, tile):
+    return False
+
+def always(game, player, tile):
+    return True
+
+def cautious(game, player, tile):
+    # Only spend while keeping a reserve of half the starting balance
+    price = tile.price["plot"] if tile.owner is None else tile.price["house"]
+
+    return player.balance - price >= game.options["starting"] // 2
+
+strategies = {
+    "never": never,
+    "always": always,
+    "cautious": cautious
+}
+
+def turn(game, decide):
+    # Plays the active player's turn, returns True if they went bankrupt
+    player = game.active_player()
+    game.roll()
+
+    tile = game.tiles[player.position]
+
+    if isinstance(tile, BuyableTile):
+        if tile.owner is None and decide(game, player, tile):
+            tile.buy(game, player)
+        elif tile.owner == player and isinstance(tile, PropertyTile) and decide(game, player, tile):
+            tile.upgrade(game, player)
+
+    game.next_turn()
+
+    if player.balance < 0:
+        game.bankrupt(player)
+
+        return True
+
+    return False
+
+def play(board: str | dict, players: int, strategy: str, seed: int, turns: int=1000):
+    """
+    Play a single game of the board headlessly and return its statistics.
+
+    The game ends when a single player is left or after the given number of turns.
+    Players whose balance is negative at the end of their turn are bankrupt.
+    The board is a path to a board file or a board object.
+    """
+    decide = strategies[strategy]
+
+    game = Game(seed)
+
+    if isinstance(board, dict):
+        game.load(copy.deepcopy(board))
+    else:
+        game.load_from_file(board)
+
+    seats = [game.add_player(f"player{i}", game.options["starting"]) for i in range(players)]
+    rent = [0] * len(game.tiles)
+    bankruptcies = 0
+
+    def on_balance(event: PlayerBalanceUpdated):
+        # Debits with a creditor are rent, charged on the tile the player landed on
+        if event.creditor and event.delta < 0:
+            rent[event.player.position] -= event.delta
+
+    game.events |= PlayerBalanceUpdated, on_balance
+
+    game.start()
+
+    while len(game.order) > 1 and game.turn < turns:
+        if turn(game, decide):
+            bankruptcies += 1
+
+    winner = None
+    if len(game.order) == 1:
+        winner = seats.index(game.players[game.order[0]])
+
+    return {
+        "turns": game.turn,
+        "bankruptcies": bankruptcies,
+        "winner": winner,
+        "rent": rent
+    }
+
+def simulate(board: str | dict, players: int=4, strategy: str="cautious", seed: int=0, games: int=1000, turns: int=1000, workers: int=None, batched: bool=False):
+    """
+    Play many games of a board across a process pool and aggregate the results.
+
+    Game i is seeded with seed + i, so a run is reproducible for a given seed.
+    Batched runs play every game in lockstep in this process instead (see
+    Batch), with the same results, for boards whose scripts it supports.
+    """
+    if strategy not in strategies:
+        raise ValueError(f"[Simulation] unknown strategy {strategy!r}, expected one of {list(strategies)}")
+
+    if batched:
+        results = Batch.play(board, games, players, strategy, seed, turns)
+    else:
+        workers = workers or os.cpu_count()
+        chunksize = max(1, games // (4 * workers))
+
+        # Workers do not log, games are only reported through their results
+        with ProcessPoolExecutor(max_workers=workers, initializer=Log.disable) as pool:
+            results = list(pool.map(
+                play,
+                repeat(board, games),
+                repeat(players, games),
+                repeat(strategy, games),
+                range(seed, seed + games),
+                repeat(turns, games),
+                chunksize=chunksize
+            ))
+
+    lengths = [result["turns"] for result in results]
+    wins = [0] * players
+    rent = [0] * len(results[0]["rent"]) if results else []
+
+    for result in results:
+        if result["winner"] is not None:
+            wins[result["winner"]] += 1
+
+        for i, amount in enumerate(result["rent"]):
+            rent[i] += amount
+
+    return {
+        "games": games,
+        "finished": sum(wins),
+        "turns": {
+            "mean": sum(lengths) / len(lengths) if lengths else 0,
+            "min": min(lengths, default=0),
+            "max": max(lengths, default=0)
+        },
+        "bankruptcies": sum(result["bankruptcies"] for result in results),
+        "wins": wins,
+        "rent": rent
+    }
@@ -0,0 +1,163 @@
+import json
+import struct
+
+from .Event import *
+
+@bindlisteners
+class StateTracker:
+    """
+    Compact snapshots of a game's state and versioned diffs derived from its events.
+
+    A snapshot holds the players (positions, balances), the active player and
+    the owner and level of every owned tile. Every change after it is a diff
+    [version, op, subject, value], where subject is a player seat (index in
+    join order) or a tile position:
+        move    seat, position
+        balance seat, balance
+        owner   tile, seat (or None when released)
+        level   tile, level
+        turn    seat, turn number
+
+    Diffs carry absolute values and consecutive versions, so a client applies
+    them in order and requests a new snapshot if it sees a gap.
+    """
+    ops = ("move", "balance", "owner", "level", "turn")
+
+    # Binary diff record: version, op, subject, value
+    record = struct.Struct("<IBhi")
+
+    def __init__(self, game):
+        self.game = game
+        self.events = game.events
+        self.version = 0
+        self.pending = []
+
+    def seat(self, player):
+        if player is None:
+            return None
+
+        return list(self.game.players).index(player.eid)
+
+    def push(self, op, subject, value):
+        self.version += 1
+        self.pending.append([self.version, op, subject, value])
+
+    def flush(self):
+        # Diffs since the last flush
+        diffs, self.pending = self.pending, []
+
+        return diffs
+
+    # Events can be dispatched while handling another event (e.g. a card moving the
+    #   player on land), so diffs report current values rather than the event's
+    @listen(PlayerMoveEvent, PlayerJailedEvent)
+    def on_move(self, event: PlayerEvent):
+        self.push("move", self.seat(event.player), event.player.position)
+
+    @listen(PlayerBalanceUpdated)
+    def on_balance(self, event: PlayerBalanceUpdated):
+        self.push("balance", self.seat(event.player), event.player.balance)
+
+        if event.creditor:
+            self.push("balance", self.seat(event.creditor), event.creditor.balance)
+
+    @listen(PropertyPurchaseEvent)
+    def on_purchase(self, event: PropertyPurchaseEvent):
+        self.push("owner", self.game.position(event.tile), self.seat(event.tile.owner))
+        self.push("balance", self.seat(event.player), event.player.balance)
+
+    @listen(PropertyUpgradeEvent)
+    def on_upgrade(self, event: PropertyUpgradeEvent):
+        self.push("level", self.game.position(event.tile), event.tile.level)
+        self.push("balance", self.seat(event.player), event.player.balance)
+
+    @listen(TradeEvent)
+    def on_trade(self, event: TradeEvent):
+        # Balances are reported by their own events
+        for position in event.trade.tiles():
+            self.push("owner", position, self.seat(self.game.tiles[position].owner))
+
+    @listen(PlayerBankruptEvent)
+    def on_bankrupt(self, event: PlayerBankruptEvent):
+        for position in event.tiles:
+            self.push("owner", position, None)
+
+            if hasattr(self.game.tiles[position], "level"):
+                self.push("level", position, 0)
+
+    @listen(TurnStart)
+    def on_turn_start(self, event: TurnStart):
+        self.push("turn", self.seat(event.player), self.game.turn)
+
+    def snapshot(self):
+        game = self.game
+
+        tiles = []
+        for position, tile in enumerate(game.tiles):
+            if getattr(tile, "owner", None) is not None:
+                tiles.append([position, self.seat(tile.owner), getattr(tile, "level", 0)])
+
+        return {
+            "version": self.version,
+            "players": [
+                {"eid": player.eid, "name": player.name, "position": player.position, "balance": player.balance}
+                for player in game.players.values()
+            ],
+            "active": self.seat(game.active_player()) if game.active is not None else None,
+            "turn": game.turn,
+            "tiles": tiles
+        }
+
+    @staticmethod
+    def apply(snapshot: dict, diffs: list):
+        # Applies diffs in order to a snapshot, as a client would
+        tiles = {tile[0]: tile for tile in snapshot["tiles"]}
+
+        for version, op, subject, value in diffs:
+            if version != snapshot["version"] + 1:
+                raise ValueError(f"[StateTracker] expected diff version {snapshot['version'] + 1}, got {version}")
+
+            snapshot["version"] = version
+
+            match op:
+                case "move":
+                    snapshot["players"][subject]["position"] = value
+                case "balance":
+                    snapshot["players"][subject]["balance"] = value
+                case "owner":
+                    tiles.setdefault(subject, [subject, None, 0])[1] = value
+                case "level":
+                    tiles.setdefault(subject, [subject, None, 0])[2] = value
+                case "turn":
+                    snapshot["active"] = subject
+                    snapshot["turn"] = value
+
+        snapshot["tiles"] = sorted(tile for tile in tiles.values() if tile[1] is not None)
+
+        return snapshot
+
+    @staticmethod
+    def encode(diffs: list):
+        return json.dumps(diffs, separators=(",", ":"))
+
+    @staticmethod
+    def pack(diffs: list):
+        # Binary encoding, 11 bytes per diff. Absent seats are packed as -1.
+        return b"".join(
+            StateTracker.record.pack(version, StateTracker.ops.index(op), subject, -1 if value is None else value)
+            for version, op, subject, value in diffs
+        )
+
+    @staticmethod
+    def unpack(data: bytes):
+        diffs = []
+
+        for version, op, subject, value in StateTracker.record.iter_unpack(data):
+            op = StateTracker.ops[op]
+
+            if op == "owner" and value == -1:
+                value = None
+
+            diffs.append([version, op, subject, value])
+
+        return diffs
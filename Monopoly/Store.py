@@ -0,0 +1,319 @@
+import os
+import json
+import time
+import atexit
+import sqlite3
+import threading
+from collections import OrderedDict
+
+from .Game import Game
+
+def diff(old: dict, new: dict):
+    # Patch turning state old into state new, players and tiles are patched per key
+    patch = {}
+
+    for key, value in new.items():
+        if key in ("players", "tiles"):
+            changed = {k: v for k, v in value.items() if old.get(key, {}).get(k) != v}
+
+            if changed:
+                patch[key] = changed
+
+        elif old.get(key) != value:
+            patch[key] = value
+
+    return patch
+
+def apply(state: dict, patch: dict):
+    for key, value in patch.items():
+        if key in ("players", "tiles"):
+            state.setdefault(key, {}).update(value)
+        else:
+            state[key] = value
+
+    return state
+
+class GameStore:
+    """
+    Append-only log of game states backed by SQLite.
+
+    Every save appends the patch between the game's previous and current state.
+    Every `interval` patches the full state is written as a snapshot and the
+    log up to it is dropped. A game is restored from its snapshot and the
+    patches after it.
+
+    Writes are queued and committed in a single transaction every `batch`
+    writes or every `delay` seconds, so there is one fsync per batch rather
+    than per write. The database is only locked while a batch is committed,
+    so several workers can share it; reads commit the queued writes first.
+    """
+    def __init__(self, path: str="./games.db", interval: int=100, batch: int=64, delay: float=1.0):
+        self.interval = interval
+        self.batch = batch
+        self.delay = delay
+
+        # Last saved state and sequence number per game id
+        self.states = {}
+
+        self.lock = threading.RLock()
+        self.db = sqlite3.connect(path, isolation_level=None, check_same_thread=False, timeout=30)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=FULL")
+        self.db.execute("CREATE TABLE IF NOT EXISTS snapshots (game TEXT PRIMARY KEY, seq INTEGER, state TEXT)")
+        self.db.execute("CREATE TABLE IF NOT EXISTS log (game TEXT, seq INTEGER, patch TEXT, PRIMARY KEY (game, seq))")
+
+        # Queued (query, args) not committed yet
+        self.pending = []
+        self.committed = time.monotonic()
+
+        threading.Thread(target=self.flusher, daemon=True).start()
+        atexit.register(self.flush)
+
+    def flusher(self):
+        while True:
+            time.sleep(self.delay)
+
+            with self.lock:
+                if self.pending and time.monotonic() - self.committed >= self.delay:
+                    self.flush()
+
+    def flush(self):
+        with self.lock:
+            if self.pending:
+                # Takes the write lock up front, waiting for other workers' batches
+                self.db.execute("BEGIN IMMEDIATE")
+
+                try:
+                    for query, args in self.pending:
+                        self.db.execute(query, args)
+
+                    self.db.execute("COMMIT")
+                except sqlite3.Error:
+                    # Writes stay queued and are retried with the next batch
+                    if self.db.in_transaction:
+                        self.db.execute("ROLLBACK")
+
+                    raise
+
+                self.pending = []
+
+            self.committed = time.monotonic()
+
+    def write(self, query, args):
+        self.pending.append((query, args))
+
+        if len(self.pending) >= self.batch:
+            self.flush()
+
+    def save(self, game_id: str, game: Game):
+        # Records the game's changes since the last save
+        state = game.state()
+
+        with self.lock:
+            if game_id not in self.states:
+                self.states[game_id] = self.tail(game_id)
+
+            old, seq = self.states[game_id]
+
+            if old is not None:
+                patch = diff(old, state)
+
+                if not patch:
+                    return
+
+            seq += 1
+
+            if old is None or seq % self.interval == 0:
+                self.write("INSERT OR REPLACE INTO snapshots VALUES (?, ?, ?)", (game_id, seq, json.dumps(state)))
+                self.write("DELETE FROM log WHERE game = ? AND seq <= ?", (game_id, seq))
+            else:
+                self.write("INSERT INTO log VALUES (?, ?, ?)", (game_id, seq, json.dumps(patch)))
+
+            self.states[game_id] = (state, seq)
+
+    def tail(self, game_id: str):
+        # Latest state of a game and its sequence number, (None, 0) if unknown
+        with self.lock:
+            self.flush()
+
+            row = self.db.execute("SELECT seq, state FROM snapshots WHERE game = ?", (game_id,)).fetchone()
+
+            if row is None:
+                return None, 0
+
+            seq, state = row
+            state = json.loads(state)
+
+            for seq, patch in self.db.execute("SELECT seq, patch FROM log WHERE game = ? AND seq > ? ORDER BY seq", (game_id, seq)):
+                apply(state, json.loads(patch))
+
+            return state, seq
+
+    def exists(self, game_id: str):
+        with self.lock:
+            self.flush()
+
+            return self.db.execute("SELECT 1 FROM snapshots WHERE game = ?", (game_id,)).fetchone() is not None
+
+    def load(self, game_id: str):
+        # Restores a game from its latest snapshot and log, None if unknown
+        state, seq = self.tail(game_id)
+
+        if state is None:
+            return None
+
+        with self.lock:
+            self.states[game_id] = (state, seq)
+
+        return Game().restore(json.loads(json.dumps(state)))
+
+    def forget(self, game_id: str):
+        # Drops the cached state of a game no longer held in memory
+        with self.lock:
+            self.states.pop(game_id, None)
+
+    def delete(self, game_id: str):
+        with self.lock:
+            self.states.pop(game_id, None)
+            self.write("DELETE FROM snapshots WHERE game = ?", (game_id,))
+            self.write("DELETE FROM log WHERE game = ?", (game_id,))
+
+def resident():
+    # Resident memory of this process in bytes, None where /proc is unavailable
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return None
+
+class GameRegistry:
+    """
+    Games held in memory, backed by a GameStore.
+
+    Games idle for longer than `ttl` seconds are evicted, as are the least
+    recently used games once there are more than `capacity` of them or the
+    process uses more than `memory` bytes. Evicted games are saved to the
+    store and restored transparently the next time they are requested.
+    Pinned games (e.g. with sockets connected) are never evicted.
+
+    Games are shared by the HTTP and socket threads, which read and change
+    a game only while holding locked(game_id).
+    """
+    def __init__(self, store: GameStore, ttl: float=1800, capacity: int=None, memory: int=None):
+        self.store = store
+        self.ttl = ttl
+        self.capacity = capacity
+        self.memory = memory
+
+        # Least recently used first, game id -> (game, last activity)
+        self.games = OrderedDict()
+        self.pinned = {}
+        self.swept = time.monotonic()
+        self.lock = threading.RLock()
+
+        # Per game locks, striped over a fixed number so they never need to be dropped
+        self.locks = [threading.RLock() for _ in range(64)]
+
+    def __contains__(self, game_id):
+        return game_id in self.games
+
+    def __len__(self):
+        return len(self.games)
+
+    def __setitem__(self, game_id, game):
+        with self.lock:
+            self.games[game_id] = (game, time.monotonic())
+            self.games.move_to_end(game_id)
+
+            self.sweep(game_id)
+
+    def __getitem__(self, game_id):
+        if (game := self.get(game_id)) is None:
+            raise KeyError(game_id)
+
+        return game
+
+    def get(self, game_id):
+        # Game by id, restored from the store if it was evicted, None if unknown
+        with self.lock:
+            if game_id in self.games:
+                game, _ = self.games[game_id]
+                self.games[game_id] = (game, time.monotonic())
+                self.games.move_to_end(game_id)
+            elif (game := self.store.load(game_id)) is not None:
+                self[game_id] = game
+
+            if time.monotonic() - self.swept >= 1.0:
+                self.sweep(game_id)
+
+            return game
+
+    def pin(self, game_id):
+        with self.lock:
+            self.pinned[game_id] = self.pinned.get(game_id, 0) + 1
+
+    def unpin(self, game_id):
+        with self.lock:
+            if self.pinned.get(game_id, 0) > 1:
+                self.pinned[game_id] -= 1
+            else:
+                self.pinned.pop(game_id, None)
+
+            if game_id in self.games:
+                self.games[game_id] = (self.games[game_id][0], time.monotonic())
+                self.games.move_to_end(game_id)
+
+    def locked(self, game_id):
+        # Lock to hold while reading or changing a game
+        return self.locks[hash(game_id) % len(self.locks)]
+
+    def evict(self, game_id):
+        # Returns whether the game was evicted, games in use by another thread are kept:
+        #   waiting for their lock here could deadlock with a thread holding it and
+        #   waiting for the registry
+        lock = self.locked(game_id)
+
+        if not lock.acquire(blocking=False):
+            return False
+
+        try:
+            with self.lock:
+                game, _ = self.games.pop(game_id)
+
+                self.store.save(game_id, game)
+                self.store.forget(game_id)
+        finally:
+            lock.release()
+
+        return True
+
+    def sweep(self, keep=None):
+        # Evicts idle games, then least recently used games while over budget, except keep
+        with self.lock:
+            now = self.swept = time.monotonic()
+            candidates = [game_id for game_id in self.games if game_id not in self.pinned and game_id != keep]
+            evicted = []
+
+            for game_id in candidates:
+                if now - self.games[game_id][1] < self.ttl:
+                    break
+
+                evicted.append(game_id)
+
+            candidates = candidates[len(evicted):]
+
+            if self.capacity is not None:
+                excess = len(self.games) - len(evicted) - self.capacity
+                evicted += candidates[:max(0, excess)]
+                candidates = candidates[max(0, excess):]
+
+            if self.memory is not None and (usage := resident()) is not None and usage > self.memory:
+                # Freed memory is not necessarily returned to the OS, so evict a quarter
+                #   of the games rather than until resident memory drops
+                evicted += candidates[:max(1, (len(self.games) - len(evicted)) // 4)]
+
+            evicted = [game_id for game_id in evicted if self.evict(game_id)]
+
+            # Evicted games only live in the store, make sure they reach the disk
+            if evicted:
+                self.store.flush()
@@ -0,0 +1,238 @@
+from uuid import uuid4
+
+from . import Log
+
+class Trade:
+    """
+    Offer between two players, by eid: the seller gives the tiles in give to
+    the buyer and receives the tiles in take from them, plus cash from the
+    buyer (the seller pays when it is negative). Tiles are board positions.
+
+    Trades are never changed once proposed, so forked games share them.
+    """
+    __slots__ = ("id", "seller", "buyer", "give", "take", "cash")
+
+    def __init__(self, seller: str, buyer: str, give=(), take=(), cash: int=0, id: str=None):
+        self.id = id or str(uuid4())
+        self.seller = seller
+        self.buyer = buyer
+        self.give = tuple(give)
+        self.take = tuple(take)
+        self.cash = cash
+
+    def __repr__(self):
+        return f"Trade(seller={self.seller}, buyer={self.buyer}, give={self.give}, take={self.take}, cash={self.cash})"
+
+    def tiles(self):
+        return self.give + self.take
+
+    def terms(self, eid: str):
+        # Terms as seen by one of the players, in the form of AI.apply
+        if eid == self.seller:
+            return {"with": self.buyer, "give": list(self.give), "take": list(self.take), "cash": self.cash}
+
+        return {"with": self.seller, "give": list(self.take), "take": list(self.give), "cash": -self.cash}
+
+    def state(self):
+        return [self.id, self.seller, self.buyer, list(self.give), list(self.take), self.cash]
+
+class TradeBook:
+    """
+    Open trades of a game, by id and indexed by player eid and by tile.
+
+    Looking up the trades of a player or on a tile, and finding the offers
+    that conflict with a trade (share one of its tiles), only visit the trades
+    concerned, however many are open.
+
+    settle() checks a batch of accepted trades against the game and each
+    other, then applies all those that pass at once: owners change, and every
+    player's balance moves by their net cash over the batch, received cash
+    repaying debts first. Nothing is applied for rejected trades, and open
+    trades on tiles that changed hands are withdrawn.
+    """
+    __slots__ = ("trades", "players", "tiles")
+
+    def __init__(self):
+        self.trades = {}
+
+        # eid -> {trade ids}, position -> {trade ids}
+        self.players = {}
+        self.tiles = {}
+
+    def __len__(self):
+        return len(self.trades)
+
+    def __iter__(self):
+        return iter(self.trades.values())
+
+    def __contains__(self, trade_id):
+        return trade_id in self.trades
+
+    def get(self, trade_id):
+        return self.trades.get(trade_id)
+
+    def copy(self):
+        book = TradeBook()
+        book.trades = dict(self.trades)
+        book.players = {eid: set(ids) for eid, ids in self.players.items()}
+        book.tiles = {position: set(ids) for position, ids in self.tiles.items()}
+
+        return book
+
+    def add(self, trade: Trade):
+        self.trades[trade.id] = trade
+
+        for eid in (trade.seller, trade.buyer):
+            self.players.setdefault(eid, set()).add(trade.id)
+
+        for position in trade.tiles():
+            self.tiles.setdefault(position, set()).add(trade.id)
+
+        return trade
+
+    def withdraw(self, trade_id):
+        # Removes an open trade, returns it or None
+        if (trade := self.trades.pop(trade_id, None)) is None:
+            return None
+
+        for eid in (trade.seller, trade.buyer):
+            TradeBook.discard(self.players, eid, trade_id)
+
+        for position in trade.tiles():
+            TradeBook.discard(self.tiles, position, trade_id)
+
+        return trade
+
+    @staticmethod
+    def discard(index, key, trade_id):
+        ids = index.get(key)
+
+        if ids is not None:
+            ids.discard(trade_id)
+
+            if not ids:
+                del index[key]
+
+    def involving(self, eid: str):
+        return [self.trades[trade_id] for trade_id in self.players.get(eid, ())]
+
+    def on(self, position: int):
+        return [self.trades[trade_id] for trade_id in self.tiles.get(position, ())]
+
+    def conflicts(self, trade: Trade):
+        # Other open trades sharing a tile with the trade
+        ids = set().union(*(self.tiles.get(position, ()) for position in trade.tiles()))
+        ids.discard(trade.id)
+
+        return [self.trades[trade_id] for trade_id in ids]
+
+    def withdraw_player(self, eid: str):
+        # Withdraws every trade of a player, e.g. when they go bankrupt
+        return [self.withdraw(trade_id) for trade_id in list(self.players.get(eid, ()))]
+
+    @staticmethod
+    def check(game, trade: Trade):
+        # Reason the trade cannot settle in the game as it is, or None
+        from .Types import BuyableTile, PropertyTile
+
+        if trade.seller == trade.buyer:
+            return "cannot trade with oneself"
+
+        if trade.seller not in game.order or trade.buyer not in game.order:
+            return "player is not in the game"
+
+        if len(set(trade.tiles())) != len(trade.tiles()):
+            return "tile listed twice"
+
+        for positions, eid in ((trade.give, trade.seller), (trade.take, trade.buyer)):
+            for position in positions:
+                if not 0 <= position < len(game.tiles):
+                    return f"no tile at {position}"
+
+                tile = game.tiles[position]
+
+                if not isinstance(tile, BuyableTile) or tile.owner is None or tile.owner.eid != eid:
+                    return f"{tile.label} is not owned by the player trading it"
+
+                # Groups are traded without buildings
+                if isinstance(tile, PropertyTile) and max(game.index.levels.get(tile.group) or (0,)) > 0:
+                    return f"{tile.label} belongs to a group with buildings"
+
+        return None
+
+    def settle(self, game, ids):
+        """
+        Settles a batch of accepted trades in one pass, in order.
+
+        A trade is rejected if it cannot settle in the game, shares a tile
+        with an earlier trade of the batch, or its payer cannot afford the
+        cash after the earlier trades. Returns (settled trades, {trade id:
+        reason} for rejected and withdrawn trades).
+        """
+        from .Event import PlayerBalanceUpdated, TradeEvent
+
+        settled, rejected = [], {}
+        claimed = set()
+        net = {}
+
+        for trade_id in ids:
+            if (trade := self.trades.get(trade_id)) is None:
+                rejected[trade_id] = "no such open trade"
+                continue
+
+            reason = TradeBook.check(game, trade)
+
+            if reason is None and claimed.intersection(trade.tiles()):
+                reason = "conflicts with a trade settled in the same batch"
+
+            payer, payee = (trade.buyer, trade.seller) if trade.cash >= 0 else (trade.seller, trade.buyer)
+            amount = abs(trade.cash)
+
+            if reason is None and game.players[payer].balance + net.get(payer, 0) < amount:
+                reason = "payer cannot afford the trade"
+
+            if reason:
+                rejected[trade_id] = reason
+                continue
+
+            claimed.update(trade.tiles())
+            net[payer] = net.get(payer, 0) - amount
+            net[payee] = net.get(payee, 0) + amount
+            settled.append(trade)
+
+        # Every check passed, apply the whole batch
+        for trade in settled:
+            seller, buyer = game.players[trade.seller], game.players[trade.buyer]
+
+            for position in trade.give:
+                game.tiles[position].owner = buyer
+
+            for position in trade.take:
+                game.tiles[position].owner = seller
+
+            self.withdraw(trade.id)
+
+        for eid, amount in net.items():
+            player = game.players[eid]
+
+            if amount > 0:
+                player.credit(game, amount)
+            elif amount < 0:
+                player.balance += amount
+                game.events += PlayerBalanceUpdated(player, amount)
+
+        # Offers on tiles that changed hands were made to the previous owners
+        for position in claimed:
+            for trade in self.on(position):
+                self.withdraw(trade.id)
+                rejected.setdefault(trade.id, "tile changed hands")
+
+        for trade in settled:
+            Log.info(
+                "trade between %s and %s settled", game.players[trade.seller].name, game.players[trade.buyer].name,
+                event="trade", trade=trade.id, seller=trade.seller, buyer=trade.buyer,
+                give=list(trade.give), take=list(trade.take), cash=trade.cash
+            )
+            game.events += TradeEvent(game.players[trade.seller], trade)
+
+        return settled, rejected
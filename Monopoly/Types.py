@@ -1,20 +1,68 @@
-from random import choices
+from time import perf_counter
+from functools import lru_cache
+
+import numpy as np
+
+from . import Log
+from .Monoscript import Monoscript
+from .Index import indexed
+from .Ledger import Ledger
+from .Metrics import metrics
 
 class Entity:
+    # eid is the string id used by the API, id a compact integer id unique within a game
+    __slots__ = ("eid", "id", "_index")
+
     def __str__(self):
         return self.eid
 
     def __hash__(self):
-        import uuid
-        return uuid.UUID(self.eid).int
+        return self.id
+
+    def copy(self, index=None):
+        # Shallow copy, attributes are shared with the original except the index,
+        #   copies belong to another game's index (or to none)
+        try:
+            clone = Entity.copier(type(self))(self)
+        except AttributeError:
+            # Some slots are unset, copy the others one by one
+            clone = object.__new__(type(self))
+
+            for slot in Entity.slots(type(self)):
+                if (value := getattr(self, slot, Entity.slots)) is not Entity.slots:
+                    setattr(clone, slot, value)
+
+        clone._index = index
+
+        return clone
+
+    @staticmethod
+    @lru_cache(maxsize=None)
+    def slots(cls):
+        return tuple(slot for base in cls.__mro__ for slot in getattr(base, "__slots__", ()) if slot != "_index")
+
+    @staticmethod
+    @lru_cache(maxsize=None)
+    def copier(cls):
+        # Function copying every slot of cls with plain attribute loads and stores, built
+        #   once per class: forks copy every buyable tile, and a getattr/setattr call
+        #   per slot made up most of their cost
+        lines = "".join(f"    clone.{slot} = self.{slot}\n" for slot in Entity.slots(cls))
+        namespace = {"new": object.__new__, "cls": cls}
+
+        exec(f"def copy(self):\n    clone = new(cls)\n{lines}    return clone\n", namespace)
+
+        return namespace["copy"]
 
 class Player(Entity):
+    __slots__ = ("name", "data", "balance", "position", "debts")
+
     def __init__(self, name, data, balance=0, position=0):
         self.name = name
         self.data = data
         self.balance = balance
         self.position = position
-        self.debts = []
+        self.debts = Ledger()
 
     def __repr__(self):
         return f"Player(name={self.name}, balance={self.balance}, position={self.position})"
@@ -29,36 +77,22 @@ class Player(Entity):
             return False
 
         self.balance -= amount
-        game += PlayerBalanceUpdated(self, -amount)
+        game.events += PlayerBalanceUpdated(self, -amount)
 
         return True
 
     def credit(self, game, amount):
-        # Credits the player's balance
+        # Credits the player's balance, debts are repaid first
         from .Event import PlayerBalanceUpdated
 
         self.balance += amount
 
-        if len(self.debts):
-            for idx, (creditor, debt) in enumerate(self.debts):
-                # If credited amount < debt, deduct amount from debt and return
-                if amount < debt:
-                    self.debts[idx] = (creditor, debt - amount)
-
-                    if creditor:
-                        creditor.balance += amount
-
-                    break
-
-                self.debts[idx] = None
+        game.events += PlayerBalanceUpdated(self, amount)
 
-                if creditor:
-                    creditor.balance += debt
-                amount -= debt
-
-            self.debts = [x for x in self.debts if x]
-
-        game += PlayerBalanceUpdated(self, amount)
+        for creditor, paid in self.debts.repay(amount):
+            if creditor:
+                creditor.balance += paid
+                game.events += PlayerBalanceUpdated(creditor, paid)
 
     def debit(self, game, creditor, amount):
         from .Event import PlayerBalanceUpdated
@@ -71,14 +105,14 @@ class Player(Entity):
             if self.balance > 0 and creditor:
                 creditor.balance += self.balance
 
-            self.debts.append((creditor, amount - max(0, self.balance)))
+            self.debts.owe(creditor, amount - max(0, self.balance))
         elif creditor:
             creditor.balance += amount
 
         # Debits whole amount from player's account
         self.balance -= amount
 
-        game += PlayerBalanceUpdated(self, -amount)
+        game.events += PlayerBalanceUpdated(self, -amount, creditor)
 
 def associate(*association):
     def wrapper(cls):
@@ -96,31 +130,122 @@ def associate(*association):
 
 @associate("name", "data")
 class LootTable(Entity):
+    """
+    Weighted table of cards.
+
+    Draws use a Walker/Vose alias table built once at load time, so a draw is
+    one uniform number and two lookups whatever the weights.
+
+    With "deck" set in its data, cards are instead dealt without replacement
+    from a deck holding weight copies of each card. The deck is shuffled lazily,
+    one swap per card dealt, and dealt again from the start once exhausted.
+    Decks are per game (see Game.decks), the table itself is shared.
+    """
+    __slots__ = ("name", "data", "weights", "probability", "alias", "deck")
+
     def __init__(self, name, data):
         self.name = name
         self.data = data
+        self.weights = tuple(data["weights"])
+        self.probability, self.alias = LootTable.build(self.weights)
+
+        self.deck = None
+        if data.get("deck"):
+            self.deck = [card for card, weight in zip(data["cards"], self.weights) for _ in range(weight)]
+
+    @staticmethod
+    def build(weights):
+        # Vose's alias method: column i is kept with probability[i], otherwise alias[i] is drawn
+        n = len(weights)
+        total = sum(weights)
+        scaled = [weight * n / total for weight in weights]
+        probability, alias = [1.0] * n, list(range(n))
+
+        small = [i for i, p in enumerate(scaled) if p < 1.0]
+        large = [i for i, p in enumerate(scaled) if p >= 1.0]
+
+        while small and large:
+            less, more = small.pop(), large.pop()
+
+            probability[less] = scaled[less]
+            alias[less] = more
+
+            scaled[more] += scaled[less] - 1.0
+            (small if scaled[more] < 1.0 else large).append(more)
+
+        # Leftovers are 1 up to rounding errors
+        for i in small + large:
+            probability[i] = 1.0
+
+        return probability, alias
+
+    def column(self, u: float):
+        # Index of the card drawn by a uniform number u in [0, 1)
+        x = u * len(self.probability)
+        i = int(x)
+
+        return i if x - i < self.probability[i] else self.alias[i]
+
+    def choice(self, game):
+        # Card drawn from the game's random stream
+        if self.deck is not None:
+            return self.deal(game)
 
-    def choice(self):
-        card = choices(population=self.data["cards"], weights=self.data["weights"], k=1)[0]
+        return self.data["cards"][self.column(game.rng.uniform())]
+
+    def draw(self, game, k: int):
+        # k cards drawn at once, e.g. for simulations
+        if self.deck is not None:
+            return [self.deal(game) for _ in range(k)]
+
+        x = np.asarray(game.rng.uniforms(k)) * len(self.probability)
+        i = x.astype(int)
+        columns = np.where(x - i < np.asarray(self.probability)[i], i, np.asarray(self.alias)[i])
+
+        return np.asarray(self.data["cards"])[columns].tolist()
+
+    def deal(self, game):
+        # Lazy Fisher-Yates: swap a random card of the undealt part to its end and deal it
+        if (deck := game.decks.get(self.eid)) is None:
+            deck = game.decks[self.eid] = [list(self.deck), len(self.deck)]
+
+        if deck[1] == 0:
+            deck[1] = len(deck[0])
+
+        cards, remaining = deck
+        j = int(game.rng.uniform() * remaining)
+        cards[j], cards[remaining - 1] = cards[remaining - 1], cards[j]
+        deck[1] -= 1
+
+        return cards[remaining - 1]
 
-        return card
-    
     def __repr__(self):
         return f"{self.__class__.__name__}(name={self.name})"
 
 @associate("text", "script")
 class Card(Entity):
+    __slots__ = ("text", "script", "program", "template")
+
     def __init__(self, text, script):
         self.text = text
         self.script = script
 
+        # Compiled once when the board is loaded, drawing a card only walks these
+        self.program = Monoscript.compile(script)
+        self.template = Monoscript.compile_template(text)
+
     def execute(self, game, player):
         context = {"player": player}
-        game.execute(self.script, context=context)
 
-        tokens = game.monoscript.tokenize(self.text)
-        game.monoscript.bindTokens(tokens, context)
-        text = " ".join(tokens)
+        if not metrics.sample():
+            game.monoscript.run(self.program, context)
+
+            return game.monoscript.render(self.template, context)
+
+        start = perf_counter()
+        game.monoscript.run(self.program, context)
+        text = game.monoscript.render(self.template, context)
+        metrics.observe("monopoly_card_seconds", (("card", self.text),), perf_counter() - start)
 
         return text
 
@@ -129,6 +254,8 @@ class Card(Entity):
 
 @associate("name", "method", "base", "modifier")
 class Industry(Entity):
+    __slots__ = ("name", "method", "base", "modifier")
+
     def __init__(self, name, method, base, modifier):
         self.name = name
         self.method = method
@@ -137,6 +264,8 @@ class Industry(Entity):
 
 @associate("label")
 class Group(Entity):
+    __slots__ = ("label",)
+
     def __init__(self, label):
         self.label = label
 
@@ -164,7 +293,7 @@ class Meta(type):
             return wrapper
 
         if T:
-            intersect = (set(T.__dict__) & set(attrs)) - set(["__module__", "__init__"])
+            intersect = (set(T.__dict__) & set(attrs)) - set(["__module__", "__init__", "__slots__"])
 
             for fn in intersect:
                 attrs[fn] = wrap(fn, getattr(bases[0], fn, lambda: None), attrs.setdefault(fn, lambda: None))
@@ -173,9 +302,14 @@ class Meta(type):
 
 @associate("label", "events")
 class Tile(Entity, metaclass=Meta):
+    __slots__ = ("label", "events", "programs")
+
     @staticmethod
     def type_from_string(string):
         match string:
+            case "Action":
+                type = ActionTile
+
             case "Chest":
                 type = ChestTile
 
@@ -193,24 +327,32 @@ class Tile(Entity, metaclass=Meta):
     def __init__(self, label, events={}):
         self.label = label
         self.events = events
+        self.programs = {event: Monoscript.compile(script) for event, script in events.items()}
 
     def __repr__(self):
         return f"{self.__class__.__name__}(name={self.label})"
 
     def on_land(self, game, player):
-        if "land" not in self.events:
+        if "land" not in self.programs:
             return
 
-        game.execute(self.events["land"], context={"player": player})
+        game.monoscript.run(self.programs["land"], {"player": player})
 
     def on_pass(self, game, player):
-        if "pass" not in self.events:
+        if "pass" not in self.programs:
             return
 
-        game.execute(self.events["pass"], context={"player": player})
+        game.monoscript.run(self.programs["pass"], {"player": player})
+
+class ActionTile(Tile):
+    __slots__ = ()
 
 @associate("price")
 class BuyableTile(Tile):
+    __slots__ = ("price", "_owner")
+
+    owner = indexed()
+
     def __init__(self, label, price, owner=None, events={}):
         super().__init__(label, events)
 
@@ -225,10 +367,10 @@ class BuyableTile(Tile):
             return False
 
         # Check that player has enough money
-        if player.balance < self.price:
+        if player.balance < self.price["plot"]:
             return False
 
-        player.balance -= self.price
+        player.balance -= self.price["plot"]
         self.owner = player
 
         game.events += PropertyPurchaseEvent(player, self)
@@ -243,22 +385,29 @@ class BuyableTile(Tile):
 
 @associate("table")
 class ChestTile(Tile):
+    __slots__ = ("table",)
+
     def __init__(self, label, table, events={}):
         super().__init__(label, events)
 
         self.table = table
 
     def on_land(self, game, player):
-        card = self.table.choice()
+        card = self.table.choice(game)
         card = game.cards[card]
 
         text = card.execute(game, player)
 
-        print(f"player {player!r} drew from {self.table!r}, card: {text!r}")
+        Log.info(
+            "player %s drew from %s, card: %r", player.name, self.table.name, text,
+            event="draw", table=self.table.name, card=text, player=player.eid
+        )
 
 
 @associate("industry")
 class CompanyTile(BuyableTile):
+    __slots__ = ("industry",)
+
     def __init__(self, label, price, industry, events={}):
         super().__init__(label, price, events=events)
         self.industry = industry
@@ -269,6 +418,10 @@ class CompanyTile(BuyableTile):
 
 @associate("group", "rent")
 class PropertyTile(BuyableTile):
+    __slots__ = ("group", "rent", "_level")
+
+    level = indexed()
+
     def __init__(self, label, price, group, rent, level=0, events={}):
         super().__init__(label, price, events=events)
         self.group = group
@@ -277,29 +430,46 @@ class PropertyTile(BuyableTile):
 
     def upgrade(self, game, player):
         from .Event import PropertyUpgradeEvent
-        # FIXME: Check for monopoly before allowing upgrade
 
         if self.owner != player:
             return False
 
+        if not game.index.monopoly(self.group, player):
+            return False
+
         maxLevel = len(self.rent) - 1
 
         if self.level >= maxLevel:
             return False
 
-        if player.balance < self.price:
+        # Houses are built one at a time across the group, never above its lowest tile
+        if game.options["evenBuild"] and self.level > game.index.lowest(self.group):
+            return False
+
+        if player.balance < self.price["house"]:
             return False
 
-        player.balance -= self.price
+        player.balance -= self.price["house"]
         self.level += 1
 
         game.events += PropertyUpgradeEvent(player, self)
 
         return True
 
+    def rent_due(self, game):
+        # Rent of an unimproved tile doubles when its owner holds the whole group
+        if not self.owner:
+            return 0
+
+        rent = self.rent[self.level]
+
+        if self.level == 0 and game.options["doubleRent"] and game.index.monopoly(self.group, self.owner):
+            rent *= 2
+
+        return rent
+
     def on_land(self, game, player: Player):
         if not self.owner or self.owner == player:
             return
 
-        rent = self.rent[self.level]
-        player.debit(game, self.owner, rent)
+        player.debit(game, self.owner, self.rent_due(game))
@@ -0,0 +1,2 @@
+from .Game import Game
+from .Types import Player
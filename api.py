@@ -1,10 +1,29 @@
 import os
-from flask import Blueprint, redirect, request, send_from_directory, url_for
+from time import perf_counter
+from flask import Blueprint, Response, g, redirect, request, send_from_directory, session, url_for
 from werkzeug.utils import secure_filename
 from Monopoly import Game
+from Monopoly.Metrics import metrics
 
 bp = Blueprint("api", __name__, template_folder="templates")
 
+@bp.before_request
+def start_timer():
+    if metrics.sample():
+        g.start = perf_counter()
+
+@bp.after_request
+def record_latency(response):
+    if "start" in g:
+        labels = (("endpoint", request.endpoint), ("method", request.method), ("status", response.status_code))
+        metrics.observe("monopoly_request_seconds", labels, perf_counter() - g.start)
+
+    return response
+
+@bp.route("/metrics", methods=["GET"])
+def get_metrics():
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
 @bp.route("/", methods=["GET", "POST"])
 def default():
     return "Missing endpoint", 400
@@ -18,42 +37,56 @@ def default():
 
 @bp.route("/game/create/<map_name>", methods=["POST"])
 def create_board(map_name):
-    from app import games
+    from app import games, shards, store
 
     map_name = secure_filename(map_name)
 
+    # Games are created by the worker owning their id, pick one and forward the request to its owner
+    game_id = request.args.get("game_id")
+
+    if not game_id or game_id in games or store.exists(game_id):
+        game_id = os.urandom(3).hex()
+
+    if not shards.owns(game_id):
+        url = shards.http_url(shards.owner(game_id)) + url_for("api.create_board", map_name=map_name, game_id=game_id)
+
+        return redirect(url, 307)
+
     game = Game()
     game.load_from_file(f"./boards/{map_name}.json")
 
-    game_id = os.urandom(3).hex()
-    games[game_id] = game
+    with games.locked(game_id):
+        games[game_id] = game
+        store.save(game_id, game)
 
     return redirect(url_for("game", game_id=game_id))
 
 @bp.route("/game/<game_id>/player/join", methods=["POST"])
 def player_join(game_id):
-    from app import games
-    from Monopoly import Player
+    from app import games, load_game, store
 
-    if game_id not in games:
-        # FIXME: Add error redirect for invalid game_id
-        return redirect(f"/")
-    
-    game = games[game_id]
-    game_URL = url_for("game", game_id=game_id)
+    # Sockets change the same game from another thread
+    with games.locked(game_id):
+        if (game := load_game(game_id)) is None:
+            # FIXME: Add error redirect for invalid game_id
+            return redirect(f"/")
 
-    if "name" not in request.form:
-        # FIXME: Add error redirect for missing "name" property in POSTed data
-        return redirect(game_URL)
+        game_URL = url_for("game", game_id=game_id)
 
-    name = request.form["name"]
-
-    for player in game.players:
-        if name == game[Player.name][player]:
+        if "name" not in request.form:
             # FIXME: Add error redirect for missing "name" property in POSTed data
             return redirect(game_URL)
 
-    game.add_player(name)
+        name = request.form["name"]
+
+        for player in game.players.values():
+            if name == player.name:
+                # FIXME: Add error redirect for missing "name" property in POSTed data
+                return redirect(game_URL)
+
+        # The session token identifies the player's websocket connection
+        game.add_player(name, game.options["starting"], data={"token": session.get("token")})
+        store.save(game_id, game)
 
     return redirect(game_URL)
 
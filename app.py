@@ -1,8 +1,11 @@
 import os
 
-from flask import Flask, Blueprint, render_template, redirect, session
+from flask import Flask, Blueprint, render_template, redirect, request, session
 
-from utils import Config
+from utils import Config, Shards
+from Monopoly.Store import GameStore, GameRegistry
+from Monopoly.Metrics import metrics
+from Monopoly import Log
 
 # Initialize Flask app
 cfg = Config()
@@ -11,7 +14,50 @@ app.secret_key = "25ca83c71412e4cb81691ffe"#os.urandom(12).hex()
 
 print("DEBUG SECRET:", app.secret_key)
 
-games = {}
+# Number of workers and index of this one, set by shard.py when running several workers
+shards = Shards(
+    int(os.environ.get("MONOPOLY_SHARDS", cfg.get("shards/workers", 1))),
+    int(os.environ.get("MONOPOLY_SHARD", 0)),
+    cfg.get("shards/host", "localhost"),
+    cfg.get("shards/http_port", 5000),
+    cfg.get("shards/ws_port", 3000)
+)
+
+# Games are logged to the store after every change and restored from it on demand
+store = GameStore(
+    cfg.get("store/path", "./games.db"),
+    cfg.get("store/snapshot_interval", 100),
+    cfg.get("store/batch", 64),
+    cfg.get("store/delay", 1.0)
+)
+
+# Game events are logged from a background thread
+Log.setup(cfg.get("log/level", "INFO"), structured=cfg.get("log/structured", True))
+
+# Fraction of events, scripts and requests timed, see /api/v1/metrics
+metrics.configure(cfg.get("metrics/rate", 0.01))
+
+# Idle games are evicted to the store and restored when requested again
+games = GameRegistry(
+    store,
+    cfg.get("registry/ttl", 1800),
+    cfg.get("registry/capacity"),
+    cfg.get("registry/memory")
+)
+
+def load_game(game_id):
+    # Running game by id, restored from the store if it is not in memory
+    return games.get(game_id)
+
+@app.before_request
+def route_to_owner():
+    # Requests for a game are redirected to the worker owning it, 307 keeps the method and body
+    game_id = (request.view_args or {}).get("game_id")
+
+    if game_id is not None and not shards.owns(game_id):
+        url = shards.http_url(shards.owner(game_id)) + request.full_path.rstrip("?")
+
+        return redirect(url, 307)
 
 @app.route("/")
 def landing():
@@ -22,16 +68,18 @@ def landing():
 
 @app.route("/game/<game_id>")
 def game(game_id):
-    if game_id not in games:
+    if (instance := load_game(game_id)) is None:
         return redirect("/")
 
     if not session.get("token"):
         session["token"] = os.urandom(12).hex()
 
-    board = games[game_id].board
+    board = instance.board
     groups = { group["label"]: group for group in board["groups"] }
 
-    return render_template("game.html", properties=board["properties"], tiles=board["tiles"], groups=groups)
+    socket = f"{shards.ws_url(shards.index)}/{game_id}"
+
+    return render_template("game.html", properties=board["properties"], tiles=board["tiles"], groups=groups, socket=socket)
 
 import api
 
@@ -0,0 +1,41 @@
+import sys
+import json
+import argparse
+
+from Monopoly.Benchmark import benchmarks, compare, run, synthetic
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the game engine on a board and synthetic large boards.")
+    parser.add_argument("-b", "--board", default="./boards/wordwide.json", help="path to the board JSON")
+    parser.add_argument("-d", "--dimension", type=int, nargs="*", default=[101, 501], help="dimensions of the synthetic boards")
+    parser.add_argument("-k", "--only", choices=list(benchmarks), nargs="*", help="benchmarks to run (default: all)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("-r", "--repeat", type=int, default=5, help="runs per benchmark, the best is kept")
+    parser.add_argument("-o", "--output", help="write the results as JSON, e.g. to save a baseline")
+    parser.add_argument("--baseline", help="baseline JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed slowdown against the baseline, as a fraction")
+    args = parser.parse_args()
+
+    with open(args.board, "rb") as f:
+        boards = {"board": json.load(f)}
+
+    for dimension in args.dimension:
+        boards[f"synthetic-{dimension}"] = synthetic(dimension)
+
+    results = run(boards, args.only, args.seed, args.repeat)
+
+    print(json.dumps(results, indent=4))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=4)
+
+    if args.baseline:
+        with open(args.baseline, "rb") as f:
+            regressions = compare(json.load(f), results, args.threshold)
+
+        for label, name, expected, value in regressions:
+            print(f"[benchmark] {label}/{name} regressed: {value:.1f}/s against {expected:.1f}/s", file=sys.stderr)
+
+        if regressions:
+            sys.exit(1)
@@ -0,0 +1,26 @@
+import os
+import sys
+import argparse
+import subprocess
+
+from utils import Config
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve games from several worker processes, each owning the games whose id hashes to it.")
+    parser.add_argument("-w", "--workers", type=int, default=None, help="number of worker processes (default: shards/workers in config.json)")
+    args = parser.parse_args()
+
+    workers = args.workers or Config().get("shards/workers", 1)
+
+    # Each worker runs ws.py, serving HTTP and websockets for its own games
+    processes = [
+        subprocess.Popen([sys.executable, "ws.py"], env=os.environ | {"MONOPOLY_SHARDS": str(workers), "MONOPOLY_SHARD": str(index)})
+        for index in range(workers)
+    ]
+
+    try:
+        for process in processes:
+            process.wait()
+    except KeyboardInterrupt:
+        for process in processes:
+            process.terminate()
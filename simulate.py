@@ -0,0 +1,20 @@
+import json
+import argparse
+
+from Monopoly.Simulation import simulate, strategies
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Play many headless games of a board and report aggregate statistics.")
+    parser.add_argument("board", help="path to the board JSON, e.g. ./boards/wordwide.json")
+    parser.add_argument("-p", "--players", type=int, default=4)
+    parser.add_argument("-s", "--strategy", choices=list(strategies), default="cautious")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("-n", "--games", type=int, default=1000)
+    parser.add_argument("-t", "--turns", type=int, default=1000, help="maximum number of turns per game")
+    parser.add_argument("-w", "--workers", type=int, default=None, help="number of worker processes (default: all cores)")
+    parser.add_argument("-b", "--batched", action="store_true", help="play all games in lockstep on arrays in one process")
+    args = parser.parse_args()
+
+    summary = simulate(args.board, args.players, args.strategy, args.seed, args.games, args.turns, args.workers, args.batched)
+
+    print(json.dumps(summary, indent=4))
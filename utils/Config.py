@@ -30,9 +30,13 @@ class Config:
             print(e)
             exit(1)
 
-    def get(self, path):
+    def get(self, path, default=None):
         path_list = path.split("/")
-        return reduce(operator.getitem, path_list, self.cfg)
+
+        try:
+            return reduce(operator.getitem, path_list, self.cfg)
+        except (KeyError, TypeError):
+            return default
 
     def get_path(self, path):
         return Path(self.get(path))
@@ -0,0 +1,32 @@
+import zlib
+
+class Shards:
+    """
+    Assignment of games to worker processes.
+
+    Every game is owned by exactly one worker, chosen by a stable hash of its
+    game_id, so that a game only ever has one writer. Worker i serves HTTP on
+    http_port + i and websockets on ws_port + i.
+    """
+    def __init__(self, workers: int=1, index: int=0, host: str="localhost", http_port: int=5000, ws_port: int=3000):
+        if not 0 <= index < workers:
+            raise ValueError(f"[Shards] worker index {index} out of range for {workers} workers")
+
+        self.workers = workers
+        self.index = index
+        self.host = host
+        self.http_port = http_port
+        self.ws_port = ws_port
+
+    def owner(self, game_id: str):
+        # crc32 rather than hash(), which is salted per process
+        return zlib.crc32(game_id.encode()) % self.workers
+
+    def owns(self, game_id: str):
+        return self.owner(game_id) == self.index
+
+    def http_url(self, worker: int):
+        return f"http://{self.host}:{self.http_port + worker}"
+
+    def ws_url(self, worker: int):
+        return f"ws://{self.host}:{self.ws_port + worker}"
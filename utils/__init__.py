@@ -1 +1,2 @@
 from .Config import Config
+from .Shard import Shards
@@ -1,10 +1,20 @@
+import json
 import asyncio
+import threading
 from websockets import WebSocketServerProtocol
 from websockets.server import serve
+from websockets.legacy.protocol import broadcast
 import http
 import http.cookies
 
-app_secret = "25ca83c71412e4cb81691ffe"
+from app import app, games, load_game, shards, store
+from Monopoly import AI
+from Monopoly.Event import TurnEnd, unbindlisteners
+from Monopoly.State import StateTracker
+from Monopoly.Trade import TradeBook
+from Monopoly.Types import BuyableTile, PropertyTile
+
+app_secret = app.secret_key
 
 # Based off of https://github.com/python-websockets/websockets/blob/1bf9d1d766c80da4887240737266926f173fbcef/experiments/authentication/app.py#L36
 def get_cookie(raw, key):
@@ -21,7 +31,18 @@ class Auth(WebSocketServerProtocol):
         if session is None or "token" not in session:
             return http.HTTPStatus.UNAUTHORIZED, [], b"missing token\n"
 
+        # Sockets connect to ws://host:port/<game_id>
+        game_id = path.strip("/")
+
+        # Browsers do not follow redirects on websockets, the game page links the owner's socket
+        if not shards.owns(game_id):
+            return http.HTTPStatus.MISDIRECTED_REQUEST, [], f"connect to {shards.ws_url(shards.owner(game_id))}\n".encode()
+
+        if load_game(game_id) is None:
+            return http.HTTPStatus.NOT_FOUND, [], b"unknown game\n"
+
         self.token = session["token"]
+        self.game_id = game_id
 
 # From https://gist.github.com/babldev/502364a3f7c9bafaa6db
 def decode_flask_cookie(secret_key, cookie_str):
@@ -37,14 +58,341 @@ def decode_flask_cookie(secret_key, cookie_str):
     s = URLSafeTimedSerializer(secret_key, salt=salt, serializer=serializer, signer_kwargs=signer_kwargs)
     return s.loads(cookie_str)
 
+class Room:
+    """
+    Sockets connected to a game.
+
+    A socket receives a JSON snapshot of the game when it joins, then the
+    binary packed state diffs produced by every action, see StateTracker.
+    Actions are only accepted from the socket of the player whose turn it is.
+
+    Bots, and players who dropped out of a started game, are played by
+    AI.Bot. Their turns run as a task, decisions are made in the bot pool.
+
+    Trades can be proposed, accepted and withdrawn by any player once the
+    game has started. Players receive their open trades as {"trades": [...]}
+    whenever these change, bots decide on the trades offered to them. A tile
+    is in at most one open trade, conflicting proposals are rejected.
+
+    HTTP routes run in another thread, the room only reads or changes the
+    game while holding its lock, and never across an await.
+    """
+    def __init__(self, game_id, game):
+        self.game_id = game_id
+        self.game = game
+        self.lock = games.locked(game_id)
+        self.state = StateTracker(game)
+        self.sockets = set()
+        self.rolled = False
+        self.task = None
+        self.offers = set()
+
+        game.events |= TurnEnd, self.on_turn_end
+
+    def on_turn_end(self, event: TurnEnd):
+        self.rolled = False
+
+    def close(self):
+        # Detaches the room from its game once the last socket leaves
+        if self.task is not None:
+            self.task.cancel()
+
+        for task in self.offers:
+            task.cancel()
+
+        self.publish()
+
+        unbindlisteners(self.state)
+        self.game.events.remove_handler(TurnEnd, self.on_turn_end)
+
+    def publish(self):
+        if diffs := self.state.flush():
+            store.save(self.game_id, self.game)
+            broadcast(self.sockets, StateTracker.pack(diffs))
+
+    def player(self, token):
+        for player in self.game.players.values():
+            if player.data.get("token") == token:
+                return player
+
+        return None
+
+    def act(self, token, message):
+        # Applies an action to the game, returns an error message or None
+        game = self.game
+
+        if not (player := self.player(token)):
+            return "not a player in this game"
+
+        action = message.get("action")
+
+        if action == "bot":
+            if game.active is not None:
+                return "game already started"
+
+            if not isinstance(level := message.get("level", "normal"), str) or level not in AI.levels:
+                return f"unknown level {level!r}"
+
+            bots = sum(1 for other in game.players.values() if "bot" in other.data)
+            game.add_player(f"Bot {bots + 1}", game.options["starting"], data={"bot": level})
+            store.save(self.game_id, game)
+
+            return None
+
+        if action == "start":
+            if game.active is not None:
+                return "game already started"
+
+            game.start()
+
+            return None
+
+        if game.active is None:
+            return "game has not started"
+
+        if action in ("propose", "accept", "withdraw"):
+            return self.trade(player, action, message)
+
+        if game.active_player() != player:
+            return "not your turn"
+
+        match action:
+            case "roll":
+                if self.rolled:
+                    return "already rolled"
+
+                self.rolled = True
+                game.roll()
+
+            case "buy":
+                tile = game.tiles[player.position]
+
+                if not isinstance(tile, BuyableTile) or not tile.buy(game, player):
+                    return "cannot buy this tile"
+
+            case "upgrade":
+                if not isinstance(eid := message.get("tile"), str):
+                    return "tile must be an entity id"
+
+                tile = game.entities.get(eid)
+
+                if not isinstance(tile, PropertyTile) or not tile.upgrade(game, player):
+                    return "cannot upgrade this tile"
+
+            case "end":
+                if not self.rolled:
+                    return "roll before ending the turn"
+
+                game.next_turn()
+
+            case _:
+                return f"unknown action {action!r}"
+
+        return None
+
+    def trade(self, player, action, message):
+        # Trade actions, returns an error message or None
+        game = self.game
+
+        match action:
+            case "propose":
+                eid = message.get("with")
+                give, take, cash = message.get("give", []), message.get("take", []), message.get("cash", 0)
+
+                if not isinstance(eid, str) or (other := game.players.get(eid)) is None:
+                    return "unknown player"
+
+                if not isinstance(give, list) or not isinstance(take, list) or not all(
+                    isinstance(value, int) and not isinstance(value, bool) for value in (*give, *take, cash)
+                ):
+                    return "tiles and cash must be integers"
+
+                trade = game.create_trade(player, other, give, take, cash)
+
+                # Offers are checked again when accepted, the game may have changed by then
+                if reason := TradeBook.check(game, trade):
+                    game.trades.withdraw(trade.id)
+
+                    return reason
+
+                # A tile is in at most one open trade, the other one has to be withdrawn first
+                if conflicts := game.trades.conflicts(trade):
+                    game.trades.withdraw(trade.id)
+
+                    return "tiles already in open trades " + ", ".join(other.id for other in conflicts)
+
+                if level := other.data.get("bot"):
+                    task = asyncio.create_task(self.consider(trade, AI.Bot(level)))
+                    self.offers.add(task)
+                    task.add_done_callback(self.offers.discard)
+
+                self.notify(player.eid, other.eid)
+
+            case "accept":
+                ids = message.get("trades", [])
+
+                if not isinstance(ids, list) or not all(
+                    isinstance(trade_id, str) and (trade := game.trades.get(trade_id)) is not None and trade.buyer == player.eid
+                    for trade_id in ids
+                ):
+                    return "only open trades offered to you can be accepted"
+
+                ids = list(dict.fromkeys(ids))
+
+                _, rejected = game.settle_trades(ids)
+
+                # Settling withdraws the offers on tiles that changed hands, whoever made them
+                self.notify(*game.players)
+
+                if failed := [reason for trade_id, reason in rejected.items() if trade_id in ids]:
+                    return "; ".join(failed)
+
+            case "withdraw":
+                trade_id = message.get("trade")
+
+                # Declining a trade offered to you withdraws it
+                if not isinstance(trade_id, str) or (trade := game.trades.get(trade_id)) is None or player.eid not in (trade.seller, trade.buyer):
+                    return "no such trade"
+
+                game.trades.withdraw(trade.id)
+                self.notify(trade.seller, trade.buyer)
+
+        return None
+
+    def notify(self, *eids):
+        # Sends players their open trades
+        for ws in list(self.sockets):
+            if (player := self.player(ws.token)) and player.eid in eids:
+                trades = [trade.state() for trade in self.game.trades.involving(player.eid)]
+                broadcast([ws], json.dumps({"trades": trades}))
+
+    async def consider(self, trade, bot):
+        # A bot accepts or declines a trade offered to it
+        game = self.game
+        loop = asyncio.get_running_loop()
+
+        with self.lock:
+            state = game.state()
+
+        accepted = await loop.run_in_executor(None, bot.evaluate, state, trade.buyer, ("trade", trade.terms(trade.buyer)))
+
+        with self.lock:
+            if trade.id not in game.trades:
+                return
+
+            if accepted:
+                game.settle_trades([trade.id])
+                self.notify(*game.players)
+            else:
+                game.trades.withdraw(trade.id)
+                self.notify(trade.seller, trade.buyer)
+
+            self.publish()
+
+    def play(self):
+        # Schedules bot turns, if a bot is to play and none are running
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self.bots())
+
+    async def bots(self):
+        # Plays bot turns until a connected player is to play
+        game = self.game
+        loop = asyncio.get_running_loop()
+
+        while self.sockets and game.active is not None and len(game.order) > 1:
+            with self.lock:
+                player = game.active_player()
+
+                if (level := player.data.get("bot")) is None:
+                    break
+
+                if not self.rolled:
+                    self.rolled = True
+                    game.roll()
+                    self.publish()
+
+                if action := AI.Bot.candidate(game, player):
+                    tile = game.tiles[action[1]]
+                    fallback = AI.cautious(game, player, tile)
+                    state = game.state()
+
+            # Decided in a thread from a copy of the state, the game is only changed here
+            if action and await loop.run_in_executor(None, AI.Bot(level).evaluate, state, player.eid, action, fallback):
+                with self.lock:
+                    AI.apply(game, player, action)
+
+            with self.lock:
+                game.next_turn()
+                self.publish()
+
+rooms = {}
+
 async def handler(ws):
-    await ws.send(f"Hello, client: {ws.token}")
+    with games.locked(ws.game_id):
+        if ws.game_id not in rooms:
+            rooms[ws.game_id] = Room(ws.game_id, load_game(ws.game_id))
+
+        room = rooms[ws.game_id]
+
+        # Games with sockets connected stay in memory, the room holds on to them
+        games.pin(ws.game_id)
 
-    async for msg in ws:
-        await ws.send(f"Client, received {msg!r}")
+        # Players who dropped out take their seat back from the bot
+        if (player := room.player(ws.token)) and player.data.pop("dropped", False):
+            player.data.pop("bot", None)
+
+        # Diffs since the last action have not been published yet, the snapshot includes them
+        room.publish()
+        room.sockets.add(ws)
+        snapshot = room.state.snapshot()
+
+    # The socket is registered, it has to be released however the connection ends
+    try:
+        await ws.send(json.dumps({"snapshot": snapshot}))
+
+        async for msg in ws:
+            try:
+                message = json.loads(msg)
+            except ValueError:
+                message = None
+
+            if not isinstance(message, dict):
+                await ws.send(json.dumps({"error": "expected a JSON object"}))
+                continue
+
+            with room.lock:
+                error = room.act(ws.token, message)
+                room.publish()
+                room.play()
+
+            if error:
+                await ws.send(json.dumps({"error": error}))
+    finally:
+        with room.lock:
+            room.sockets.discard(ws)
+            games.unpin(ws.game_id)
+
+            # A player leaving a started game is played by a bot until they reconnect
+            player = room.player(ws.token)
+            connected = any(other.token == ws.token for other in room.sockets)
+
+            if player and not connected and room.game.active is not None and "bot" not in player.data:
+                player.data["bot"] = "easy"
+                player.data["dropped"] = True
+                room.play()
+
+            if not room.sockets:
+                room.close()
+                del rooms[ws.game_id]
 
 async def main():
-    async with serve(handler, host="localhost", port=3000, create_protocol=Auth):
+    async with serve(handler, host=shards.host, port=shards.ws_port + shards.index, create_protocol=Auth):
         await asyncio.Future()
 
-asyncio.run(main())
\ No newline at end of file
+if __name__ == "__main__":
+    AI.warm()
+
+    # Serve the Flask app from a background thread so HTTP routes and sockets share the games
+    threading.Thread(target=app.run, kwargs={"host": shards.host, "port": shards.http_port + shards.index}, daemon=True).start()
+
+    asyncio.run(main())